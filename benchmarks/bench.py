@@ -0,0 +1,191 @@
+"""Benchmarks of the irext decoder and the controller encoders.
+
+Runs offline over a directory of irext AC bins, or over the synthetic corpus
+of synthetic.py when no directory is given, and writes the results as json:
+
+    python benchmarks/bench.py [--codes DIR] [--output results.json]
+    python benchmarks/bench.py --compare old.json new.json
+
+Measured per bin:
+    parse_us        AC(bin), the tags are parsed on first use
+    capabilities_us AC(bin) and get_capabilities, parsing the tags they read
+    decode_us       one ir_decode after a warm-up decode
+    expand_ms       bin_to_json, every frame of the model
+    expand_peak_kib peak memory allocated by bin_to_json
+    dedup_ratio     frames per distinct frame of the model
+    broadlink_us    BroadlinkController.encode of the power off frame
+    esphome_us      ESPHomeController.encode of the power off frame
+    mqtt_us         MQTTController.encode of the power off frame
+    <format>_bytes  MQTT payload size of the power off frame in every format
+
+The component imports home assistant, so run it in an environment where the
+homeassistant package is installed.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from custom_components.smartac.controller import (  # noqa: E402
+    BROADLINK_CONTROLLER,
+    ESPHOME_CONTROLLER,
+    MQTT_CONTROLLER,
+    MQTT_FORMATS,
+    get_controller,
+)
+from custom_components.smartac.irext import MODE_AUTO, POWER_OFF, SPEED_AUTO, AC  # noqa: E402
+from custom_components.smartac.util import bin_to_json, get_capabilities  # noqa: E402
+import synthetic  # noqa: E402
+
+RESULTS_VERSION = 1
+METRICS = ['parse_us', 'capabilities_us', 'decode_us', 'expand_ms', 'expand_peak_kib',
+           'dedup_ratio', 'broadlink_us', 'esphome_us', 'mqtt_us'] + ['%s_bytes' % f for f in MQTT_FORMATS]
+
+
+def _best(func, number, repeat=5):
+    """Return the best time of one call in seconds."""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        elapsed = (time.perf_counter() - start) / number
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def bench_bin(bin_data, number):
+    """Return the metrics of one bin, or None when it has no usable mode."""
+    ac = AC(bin_data)
+    if not ac.get_supported_mode():
+        return None
+
+    result = {'size': len(bin_data)}
+    result['parse_us'] = _best(lambda: AC(bin_data), number) * 1e6
+    result['capabilities_us'] = _best(lambda: get_capabilities(AC(bin_data)), number) * 1e6
+
+    ac.ir_decode(POWER_OFF, 26, MODE_AUTO, SPEED_AUTO)
+    result['decode_us'] = _best(
+        lambda: ac.ir_decode(POWER_OFF, 26, MODE_AUTO, SPEED_AUTO), number) * 1e6
+
+    result['expand_ms'] = _best(lambda: bin_to_json(bin_data), 1, 3) * 1e3
+    tracemalloc.start()
+    device_data = bin_to_json(bin_data)
+    result['expand_peak_kib'] = tracemalloc.get_traced_memory()[1] / 1024
+    tracemalloc.stop()
+
+    result['dedup_ratio'] = device_data['commands'].dedup_ratio
+    frame = device_data['commands'].off()
+    result['frame_pulses'] = len(frame)
+    for name, controller in ((BROADLINK_CONTROLLER, 'broadlink_us'),
+                             (ESPHOME_CONTROLLER, 'esphome_us'),
+                             (MQTT_CONTROLLER, 'mqtt_us')):
+        encoder = get_controller(None, name, 'bench.bench', 0)
+        result[controller] = _best(lambda: encoder.encode(frame), number) * 1e6
+    for payload_format in MQTT_FORMATS:
+        encoder = get_controller(None, MQTT_CONTROLLER, 'bench/bench', 0, payload_format)
+        result['%s_bytes' % payload_format] = len(encoder.encode(frame))
+
+    return result
+
+
+def run(codes_dir, number):
+    """Benchmark every bin of a directory."""
+    bins = {}
+    for name in sorted(os.listdir(codes_dir)):
+        if not name.endswith('.bin'):
+            continue
+        with open(os.path.join(codes_dir, name), 'rb') as f:
+            bins[name] = f.read()
+
+    results = {}
+    for name, bin_data in bins.items():
+        try:
+            result = bench_bin(bin_data, number)
+        except Exception as e:
+            print('%s: %s' % (name, e), file=sys.stderr)
+            continue
+        if result is not None:
+            results[name] = result
+    return results
+
+
+def summarize(results):
+    """Return the median of every metric."""
+    return {metric: statistics.median(r[metric] for r in results.values())
+            for metric in METRICS if results}
+
+
+def compare(old, new):
+    """Print the change of the median metrics between two result files."""
+    old_summary = old['summary']
+    new_summary = new['summary']
+    print('%-16s %12s %12s %8s' % ('metric', 'old', 'new', 'change'))
+    for metric in METRICS:
+        if metric not in old_summary or metric not in new_summary:
+            continue
+        before = old_summary[metric]
+        after = new_summary[metric]
+        change = (after - before) / before * 100 if before else 0
+        print('%-16s %12.2f %12.2f %+7.1f%%' % (metric, before, after, change))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--codes', help='directory of irext bins, the synthetic corpus by default')
+    parser.add_argument('--output', help='json file to write the results to')
+    parser.add_argument('--number', type=int, default=200, help='calls per timing')
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'),
+                        help='compare two result files instead of running')
+    args = parser.parse_args()
+
+    if args.compare:
+        with open(args.compare[0]) as f:
+            old = json.load(f)
+        with open(args.compare[1]) as f:
+            new = json.load(f)
+        compare(old, new)
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        codes_dir = args.codes
+        corpus = codes_dir
+        if codes_dir is None:
+            codes_dir = tmp
+            corpus = 'synthetic-%d' % synthetic.DEFAULT_COUNT
+            synthetic.write_corpus(codes_dir)
+        results = run(codes_dir, args.number)
+
+    with open(os.path.join(ROOT, 'custom_components', 'smartac', 'manifest.json')) as f:
+        version = json.load(f)['version']
+
+    output = {
+        'results_version': RESULTS_VERSION,
+        'smartac_version': version,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'corpus': corpus,
+        'summary': summarize(results),
+        'bins': results,
+    }
+
+    for metric, value in output['summary'].items():
+        print('%-16s %10.2f' % (metric, value))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(output, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,136 @@
+"""Deterministic synthetic irext AC bins.
+
+The generated models follow the irext tag layout and exercise the same
+decoder paths as the real library: type 1 and type 2 segments, static and
+dynamic temperatures, every checksum type, bit numbers, delay codes, banned
+functions and repeats. Usage:
+
+    python benchmarks/synthetic.py <directory> [count]
+"""
+import os
+import random
+import sys
+
+# tag order of an irext AC bin
+TAGS = [1, 2, 3, 4, 5, 6, 7, 21, 22, 23, 24, 25, 26, 27, 28, 29, 30, 31, 32, 33, 34,
+        41, 42, 43, 44, 45, 46, 47, 48]
+
+DEFAULT_COUNT = 60
+
+
+def _segments(segments):
+    data = bytearray()
+    for segment in segments:
+        data.append(len(segment))
+        data += bytes(segment)
+    return data.hex().upper()
+
+
+def make_bin(seed):
+    """Return the content of a synthetic bin."""
+    r = random.Random(seed)
+    length = r.choice([6, 8, 10, 13, 14])
+    tags = {}
+
+    zero = r.choice([(560, 560), (420, 420), (600, 550)])
+    one = (zero[0], r.choice([1680, 1250, 1600]))
+    tags[1] = '%d,%d' % (r.choice([3000, 4400, 9000]), r.choice([1500, 4400, 4500]))
+    tags[2] = '%d,%d' % zero
+    tags[3] = '%d,%d' % one
+    tags[4] = ''
+    if r.random() < 0.5:
+        tags[4] = '%d&%d,%d' % (r.randrange(length - 1), zero[0], 20000)
+        if r.random() < 0.5:
+            tags[4] += '|-1&%d,%d' % (zero[0], 40000)
+    tags[5] = str(length)
+    tags[6] = str(r.choice([0, 1]))
+    tags[7] = str(r.choice([0, 0, 1]))
+    tags[22] = (bytes([length]) + bytes(r.randrange(256) for _ in range(length))).hex().upper()
+
+    # the last two bytes are left for checksums
+    positions = range(0, length - 2)
+
+    def type_1(count, allow_empty=False):
+        pos = r.choice(positions)
+        return [[] if allow_empty and r.random() < 0.15 else [pos, r.randrange(256)]
+                for _ in range(count)]
+
+    def type_2(count, allow_empty=False):
+        start = r.randrange(0, (length - 2) * 8 - 8)
+        end = start + r.randint(1, 8 if start % 8 == 0 else 6)
+        return [[] if allow_empty and r.random() < 0.15 else [start, end, r.randrange(1 << (end - start))]
+                for _ in range(count)]
+
+    tags[21] = _segments(type_1(2))
+    if r.random() < 0.4:
+        tags[31] = _segments(type_2(5, True))
+        tags[32] = _segments(type_2(4, True))
+        tags[33] = _segments(type_2(2)) if r.random() < 0.6 else ''
+    else:
+        tags[24] = _segments(type_1(5, True))
+        tags[25] = _segments(type_1(4, True))
+        tags[26] = _segments(type_1(2)) if r.random() < 0.6 else ''
+
+    temperature = r.choice(['static_1', 'dynamic_1', 'static_2', 'dynamic_2'])
+    if temperature == 'static_1':
+        tags[23] = _segments(type_1(15, True))
+    elif temperature == 'dynamic_1':
+        tags[23] = bytes([2, r.choice(positions), r.choice([1, 2, 4, 16])]).hex().upper()
+    elif temperature == 'static_2':
+        tags[30] = _segments(type_2(15, True))
+    else:
+        start = r.randrange(0, (length - 2) * 8 - 8)
+        tags[30] = bytes([3, start, start + r.randint(4, 6), 1]).hex().upper()
+
+    checksums = []
+    for _ in range(r.choice([0, 1, 1, 2])):
+        checksum_type = r.randint(1, 8)
+        if checksum_type <= 4:
+            checksum = [checksum_type, 0, length - 1, length - 1]
+            if r.random() < 0.5:
+                checksum.append(r.randrange(256))
+        else:
+            spec = sorted(r.sample(range(0, (length - 1) * 2), 4))
+            checksum = [checksum_type, (length - 1) * 2 + r.choice([0, 1]), r.randrange(16)] + spec
+        checksums.append(bytes([len(checksum)] + checksum).hex().upper())
+    tags[27] = '|'.join(checksums)
+
+    tags[28] = '' if r.random() < 0.8 else bytes([1, 7]).hex().upper()
+    if r.random() < 0.5:
+        tags[29] = _segments([[1, r.choice(positions), r.randrange(256)], [5, r.choice(positions), 3]])
+    for tag in (42, 43, 44, 45):
+        tags[tag] = r.choice(['', '', '', 'S&1,2', 'T', 'T&16,17', 'S|T&30', 'NA'])
+    tags[46] = r.choice(['', '0', '1', '1,2,3'])
+    tags[47] = r.choice(['', '', '2'])
+    tags[48] = r.choice(['', '', '-1&4', '%d&4|-1&4' % (length // 2)])
+
+    data = bytearray()
+    offsets = []
+    for tag in TAGS:
+        value = tags.get(tag, '')
+        if value == '' and r.random() < 0.5:
+            offsets.append(0xFFFF)
+            continue
+        offsets.append(len(data))
+        data += value.encode()
+
+    header = bytearray([len(TAGS)])
+    for offset in offsets:
+        header += offset.to_bytes(2, 'little')
+    return bytes(header + data)
+
+
+def write_corpus(directory, count=DEFAULT_COUNT):
+    """Write count synthetic bins to a directory and return their file names."""
+    os.makedirs(directory, exist_ok=True)
+    files = []
+    for i in range(0, count):
+        name = 'irda_new_ac_%d.bin' % (90000 + i)
+        with open(os.path.join(directory, name), 'wb') as f:
+            f.write(make_bin(i))
+        files.append(name)
+    return files
+
+
+if __name__ == '__main__':
+    write_corpus(sys.argv[1], int(sys.argv[2]) if len(sys.argv) > 2 else DEFAULT_COUNT)
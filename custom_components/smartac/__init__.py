@@ -14,6 +14,8 @@ COMPONENT_ABS_DIR = os.path.dirname(
 
 CODES_AB_DIR = os.path.join(COMPONENT_ABS_DIR, 'codes')
 
+CACHE_AB_DIR = os.path.join(CODES_AB_DIR, 'compiled')
+
 PLATFORMS = [Platform.CLIMATE]
 
 
@@ -28,8 +30,13 @@ async def async_setup_entry(
 async def async_unload_entry(
     hass: HomeAssistant, config_entry: ConfigEntry
 ) -> bool:
+    from .registry import get_registry
+
     # Forward to the same platform as async_setup_entry did
-    return await hass.config_entries.async_unload_platforms(config_entry, PLATFORMS)
+    unload_ok = await hass.config_entries.async_unload_platforms(config_entry, PLATFORMS)
+    if unload_ok:
+        get_registry(hass).release(config_entry.entry_id)
+    return unload_ok
 
 
 async def async_reload_entry(hass: HomeAssistant, config_entry: ConfigEntry) -> None:
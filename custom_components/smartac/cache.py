@@ -0,0 +1,185 @@
+"""Compiled command cache for irext bin files.
+
+A cache file holds every decoded frame of a model so that a warm start only
+has to map the file instead of parsing the bin and decoding the frames. A
+repeated frame is stored once, the repeat count is part of the meta.
+
+Layout (little-endian):
+    header  magic, format version, sha256 of the bin, meta length, frame count
+    meta    json with the capabilities, ranges and repeat count of the model
+    index   (power, mode, speed, swing, temperature, offset, length) per frame
+    pulses  uint16 pulse durations of all frames, identical frames stored once
+"""
+import hashlib
+import json
+import logging
+import mmap
+import os
+import struct
+import sys
+import threading
+from array import array
+
+from .irext import AC, MAX_PULSE, Frame
+from .util import CommandTable, LazyCommands, get_capabilities, get_ranges, state_code
+
+_LOGGER = logging.getLogger(__name__)
+
+CACHE_MAGIC = b'SACC'
+CACHE_VERSION = 2
+CACHE_EXTENSION = '.cache'
+
+_HEADER = struct.Struct('<4sH32sII')
+_ENTRY = struct.Struct('<5BxxxII')
+
+
+class CacheError(Exception):
+    """The cache file is missing, stale or corrupt."""
+
+
+def bin_hash(bin_data):
+    """Return the content hash a cache file is keyed by."""
+    return hashlib.sha256(bin_data).digest()
+
+
+def cache_path(cache_dir, device_file):
+    """Return the cache file of a device bin."""
+    return os.path.join(cache_dir, os.path.splitext(device_file)[0] + CACHE_EXTENSION)
+
+
+def write_cache(path, bin_data, ac=None, table=None):
+    """Write the frames of a model to a cache file, decoding them unless a CommandTable is given."""
+    if ac is None:
+        ac = AC(bin_data)
+    swing_modes, speeds, temperatures = get_ranges(ac)
+    meta = json.dumps({
+        'capabilities': get_capabilities(ac),
+        'swingModes': swing_modes,
+        'speeds': {str(m): v for m, v in speeds.items()},
+        'temperatures': {str(m): v for m, v in temperatures.items()},
+        'repeat': ac.repeat_time,
+    }).encode('utf-8')
+
+    if table is None:
+        table = CommandTable.from_ac(ac)
+    index = bytearray()
+    count = 0
+    for key, start, length in table.entries():
+        index += _ENTRY.pack(*key, start, length)
+        count += 1
+    pulses = array('H', table.pulses)
+    if sys.byteorder != 'little':
+        pulses.byteswap()
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # concurrent writes of one cache file each use their own temporary file
+    tmp_path = '%s.%d.tmp' % (path, threading.get_ident())
+    with open(tmp_path, 'wb') as f:
+        f.write(_HEADER.pack(CACHE_MAGIC, CACHE_VERSION,
+                bin_hash(bin_data), len(meta), count))
+        f.write(meta)
+        f.write(index)
+        f.write(pulses.tobytes())
+    os.replace(tmp_path, path)
+
+
+class CompiledCommands(CommandTable):
+    """Frames served from a memory-mapped cache file."""
+
+    def __init__(self, path, bin_data):
+        with open(path, 'rb') as f:
+            try:
+                self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError as e:
+                raise CacheError('empty cache file') from e
+
+        try:
+            meta, entries = self._parse(bin_hash(bin_data))
+            self.capabilities = meta['capabilities']
+            super().__init__(
+                meta['swingModes'],
+                {int(m): v for m, v in meta['speeds'].items()},
+                {int(m): v for m, v in meta['temperatures'].items()},
+                meta['repeat'])
+            for key, offset, length in entries:
+                code = state_code(key)
+                self._starts[code] = offset
+                self._lengths[code] = length
+            self.frame_count = len(entries)
+            self.unique_count = len({offset for key, offset, length in entries})
+        except (CacheError, ValueError, KeyError, struct.error):
+            self._map.close()
+            raise
+
+    def _parse(self, digest):
+        if len(self._map) < _HEADER.size:
+            raise CacheError('truncated header')
+        magic, version, key, meta_len, count = _HEADER.unpack_from(self._map)
+        if magic != CACHE_MAGIC or version != CACHE_VERSION:
+            raise CacheError('unsupported cache format')
+        if key != digest:
+            raise CacheError('bin file changed')
+
+        pos = _HEADER.size
+        meta = json.loads(self._map[pos:pos + meta_len].decode('utf-8'))
+        pos += meta_len
+
+        pulses_start = pos + count * _ENTRY.size
+        pulses_len = (len(self._map) - pulses_start) // 2
+        entries = []
+        for i in range(count):
+            *key, offset, length = _ENTRY.unpack_from(self._map, pos + i * _ENTRY.size)
+            if offset + length > pulses_len:
+                raise CacheError('frame out of range')
+            entries.append((tuple(key), offset, length))
+
+        self._map_pulses = memoryview(self._map)[pulses_start:]
+        return meta, entries
+
+    def _frame(self, key):
+        code = state_code(key)
+        length = self._lengths[code]
+        if not length:
+            raise KeyError(key)
+        offset = self._starts[code]
+        frame = array('H')
+        frame.frombytes(self._map_pulses[offset * 2:(offset + length) * 2])
+        if sys.byteorder != 'little':
+            frame.byteswap()
+        return Frame(frame, self.repeat)
+
+
+def load_device_data(bin_data, path):
+    """Return the capabilities and commands of a model, using the cache when valid.
+
+    Without a valid cache the frames are decoded on demand, compile_cache
+    builds the cache meanwhile.
+    """
+    try:
+        return _compiled_device_data(path, bin_data)
+    except FileNotFoundError:
+        _LOGGER.debug("No compiled cache for %s", path)
+    except (OSError, CacheError, ValueError, KeyError, struct.error) as e:
+        _LOGGER.info("Discarding compiled cache %s: %s", path, e)
+
+    ac = AC(bin_data)
+    device_data = get_capabilities(ac)
+    device_data['commands'] = LazyCommands(ac)
+    return device_data
+
+
+def compile_cache(bin_data, path):
+    """Write the cache of a model and return its CompiledCommands."""
+    ac = AC(bin_data)
+    write_cache(path, bin_data, ac)
+    if ac.clamped_tags:
+        _LOGGER.warning("%s has durations above %d us in tags %s, sent as %d us",
+                        path, MAX_PULSE, sorted(ac.clamped_tags), MAX_PULSE)
+    return CompiledCommands(path, bin_data)
+
+
+def _compiled_device_data(path, bin_data):
+    commands = CompiledCommands(path, bin_data)
+    device_data = dict(commands.capabilities)
+    device_data['commands'] = commands
+    return device_data
@@ -1,7 +1,10 @@
 import asyncio
-import os.path
+from functools import partial
+import voluptuous as vol
 from homeassistant import config_entries
 from homeassistant.core import callback, HomeAssistant
+from homeassistant.helpers import entity_platform
+import homeassistant.helpers.config_validation as cv
 from homeassistant.helpers.event import async_track_state_change
 from homeassistant.helpers.restore_state import RestoreEntity
 from homeassistant.helpers.entity_platform import AddEntitiesCallback
@@ -25,9 +28,11 @@ from homeassistant.const import (
     PRECISION_WHOLE,
     CONF_UNIQUE_ID,
 )
-from . import CODES_AB_DIR, _LOGGER
-from .util import bin_to_json
+from . import _LOGGER
+from .registry import get_registry
 from .controller import get_controller
+from .scheduler import get_scheduler
+from .util import OFF_STATE
 
 from .const import (
     CONF_BRAND,
@@ -39,7 +44,15 @@ from .const import (
     CONF_TEMPERATURE_SENSOR,
     CONF_HUMIDITY_SENSOR,
     CONF_POWER_SENSOR,
-    DEFAULT_DELAY
+    CONF_DEBOUNCE,
+    CONF_FRAME_GAP,
+    CONF_PAYLOAD_FORMAT,
+    CONF_PULSE_TICK,
+    DEFAULT_DELAY,
+    DEFAULT_DEBOUNCE,
+    DEFAULT_FRAME_GAP,
+    SERVICE_RECEIVE_RAW,
+    ATTR_COMMAND
 )
 
 SUPPORT_FLAGS = (
@@ -48,6 +61,13 @@ SUPPORT_FLAGS = (
 )
 
 
+def pulse_list(value):
+    """Validate pulses given as a list or as numbers separated by commas or spaces."""
+    if isinstance(value, str):
+        value = value.replace(',', ' ').split()
+    return [int(pulse) for pulse in cv.ensure_list(value)]
+
+
 async def async_setup_entry(
     hass: HomeAssistant,
     entry: config_entries.ConfigEntry,
@@ -55,28 +75,26 @@ async def async_setup_entry(
 ) -> None:
     """Set up the IR Climate platform."""
 
-    if not os.path.isdir(CODES_AB_DIR):
-        os.makedirs(CODES_AB_DIR)
-
     device_file = entry.data[CONF_DEVICE]
-    device_bin_path = os.path.join(CODES_AB_DIR, device_file)
 
-    if not os.path.exists(device_bin_path):
+    try:
+        device_data = await get_registry(hass).async_acquire(entry.entry_id, device_file)
+    except FileNotFoundError:
         _LOGGER.error("Couldn't find the device bin file.")
         return
-
-    with open(device_bin_path, "rb") as j:
-        try:
-            device_data = bin_to_json(j.read())
-        except Exception as e:
-            _LOGGER.error("The device bin file is invalid")
-            _LOGGER.exception(e)
-            return
+    except Exception as e:
+        _LOGGER.error("The device bin file is invalid")
+        _LOGGER.exception(e)
+        return
 
     async_add_entities([SmartACClimate(
         hass, entry.data, device_data
     )])
 
+    platform = entity_platform.async_get_current_platform()
+    platform.async_register_entity_service(
+        SERVICE_RECEIVE_RAW, {vol.Required(ATTR_COMMAND): pulse_list}, 'async_receive_raw')
+
 
 class SmartACClimate(ClimateEntity, RestoreEntity):
 
@@ -89,6 +107,8 @@ class SmartACClimate(ClimateEntity, RestoreEntity):
         self._name = config.get(CONF_NAME)
         self._device_code = config.get(CONF_DEVICE)
         self._delay = DEFAULT_DELAY
+        self._debounce = config.get(CONF_DEBOUNCE, DEFAULT_DEBOUNCE)
+        self._frame_gap = config.get(CONF_FRAME_GAP, DEFAULT_FRAME_GAP)
         self._temperature_sensor = config.get(CONF_TEMPERATURE_SENSOR)
         self._humidity_sensor = config.get(CONF_HUMIDITY_SENSOR)
         self._power_sensor = config.get(CONF_POWER_SENSOR)
@@ -127,6 +147,7 @@ class SmartACClimate(ClimateEntity, RestoreEntity):
             self._support_swing = True
 
         self._temp_lock = asyncio.Lock()
+        self._send_generation = 0
         self._on_by_remote = False
 
         self._attr_unique_id = self._unique_id
@@ -140,7 +161,10 @@ class SmartACClimate(ClimateEntity, RestoreEntity):
             self.hass,
             config.get(CONF_CONTROLLER_TYPE),
             config.get(CONF_CONTROLLER_DATA),
-            self._delay)
+            self._delay,
+            config.get(CONF_PAYLOAD_FORMAT),
+            config.get(CONF_PULSE_TICK))
+        self._scheduler = get_scheduler(self.hass, self._controller)
 
     async def async_added_to_hass(self):
         """Run when entity about to be added."""
@@ -270,6 +294,9 @@ class SmartACClimate(ClimateEntity, RestoreEntity):
         return {
             'last_on_operation': self._last_on_operation,
             'data': self._device_code,
+            'transmitter_queue': self._scheduler.queue_depth,
+            'transmitter_wait': round(self._scheduler.last_wait, 3),
+            'payload_hit_rate': round(self._controller.payload_hit_rate, 3),
         }
 
     async def async_set_temperature(self, **kwargs):
@@ -333,32 +360,70 @@ class SmartACClimate(ClimateEntity, RestoreEntity):
             await self.async_set_hvac_mode(self._operation_modes[1])
 
     async def send_command(self):
+        """Send the current state, unless a newer state is sent within the debounce window."""
+        self._send_generation += 1
+        generation = self._send_generation
+        if self._debounce:
+            await asyncio.sleep(self._debounce)
+        if generation != self._send_generation:
+            return
+
         async with self._temp_lock:
+            # superseded while waiting for the previous transmission
+            if generation != self._send_generation:
+                return
             try:
                 self._on_by_remote = False
                 operation_mode = self._hvac_mode
                 fan_mode = self._current_fan_mode
                 swing_mode = self._current_swing_mode
-                target_temperature = '{0:g}'.format(self._target_temperature)
+                target_temperature = self._target_temperature
 
                 if operation_mode.lower() == HVAC_MODE_OFF:
-                    await self._controller.send(self._commands['off'])
+                    await self._transmit(OFF_STATE)
                     return
 
-                if 'on' in self._commands:
-                    await self._controller.send(self._commands['on'])
-                    await asyncio.sleep(self._delay)
-
-                if self._support_swing == True:
-                    await self._controller.send(
-                        self._commands[operation_mode][fan_mode][swing_mode][target_temperature])
-                else:
-                    await self._controller.send(
-                        self._commands[operation_mode][fan_mode][target_temperature])
+                await self._transmit(self._commands.state(
+                    operation_mode, fan_mode, swing_mode, target_temperature))
 
             except Exception as e:
                 _LOGGER.exception(e)
 
+    async def _transmit(self, state):
+        await self._scheduler.async_transmit(
+            partial(self._controller.send, key=state), partial(self._commands.frame, state), self._frame_gap)
+
+    async def async_receive_raw(self, command):
+        """Follow a frame the remote of the air conditioner sent, captured by a receiver."""
+        state_index = await get_registry(self.hass).async_state_index(self.platform.config_entry.entry_id)
+        keys = state_index.lookup(command)
+        if not keys:
+            _LOGGER.debug("%s: the received frame isn't a frame of %s", self._name, self._device_code)
+            return
+
+        # states sending the same frame can't be told apart, keep the current one then
+        try:
+            current = self._commands.state(
+                self._hvac_mode, self._current_fan_mode, self._current_swing_mode, self._target_temperature)
+        except KeyError:
+            current = None
+        hvac_mode, fan_mode, swing_mode, temperature = self._commands.names(
+            current if current in keys else keys[0])
+
+        # the air conditioner is already in this state, drop any pending send
+        self._send_generation += 1
+        self._on_by_remote = False
+        self._hvac_mode = hvac_mode
+        if hvac_mode != HVAC_MODE_OFF:
+            self._last_on_operation = hvac_mode
+        if fan_mode is not None:
+            self._current_fan_mode = fan_mode
+        if swing_mode is not None:
+            self._current_swing_mode = swing_mode
+        if temperature is not None:
+            self._target_temperature = temperature
+        self.async_write_ha_state()
+
     async def _async_temp_sensor_changed(self, entity_id, old_state, new_state):
         """Handle temperature sensor changes."""
         if new_state is None:
@@ -1,7 +1,5 @@
 """Config flow for SmartAC integration."""
 from __future__ import annotations
-import os
-import json
 import uuid
 import voluptuous as vol
 from homeassistant import config_entries
@@ -9,9 +7,16 @@ from homeassistant.const import CONF_NAME, CONF_UNIQUE_ID
 from homeassistant.core import callback
 import homeassistant.helpers.config_validation as cv
 
-from .controller import BROADLINK_CONTROLLER, ESPHOME_CONTROLLER, MQTT_CONTROLLER, get_controller
+from .controller import (
+    BROADLINK_CONTROLLER,
+    ESPHOME_CONTROLLER,
+    MQTT_CONTROLLER,
+    MQTT_FORMAT_JSON,
+    MQTT_FORMATS,
+    get_controller
+)
 
-from .irext import AC, MODE_AUTO, SPEED_AUTO, POWER_ON, POWER_OFF
+from .irext import MODE_AUTO, SPEED_AUTO, POWER_ON, POWER_OFF
 
 from .const import (
     CONF_CONTROLLER_TYPE,
@@ -24,13 +29,40 @@ from .const import (
     CONF_HUMIDITY_SENSOR,
     CONF_POWER_SENSOR,
     CONF_OK,
-    DEFAULT_DELAY
+    CONF_SEARCH,
+    CONF_DEBOUNCE,
+    CONF_FRAME_GAP,
+    CONF_PAYLOAD_FORMAT,
+    CONF_PULSE_TICK,
+    DEFAULT_DELAY,
+    DEFAULT_DEBOUNCE,
+    DEFAULT_FRAME_GAP
 )
 
-from . import CODES_AB_DIR, _LOGGER
+from . import _LOGGER
+from .library import async_load, get_catalog, load_ac
+from .scheduler import get_scheduler
 
 controllers = [ESPHOME_CONTROLLER, BROADLINK_CONTROLLER, MQTT_CONTROLLER]
 
+SECONDS_SCHEMA = vol.All(vol.Coerce(float), vol.Range(min=0, max=5))
+# microseconds, 0 keeps the resolution of the controller
+TICK_SCHEMA = vol.All(vol.Coerce(int), vol.Range(min=0, max=1000))
+
+
+def decode_test_frame(ac, power_on):
+    """Return the power on/off frame used to test a model."""
+    all_modes = ac.get_supported_mode()
+    mode = MODE_AUTO if MODE_AUTO in all_modes else all_modes[0]
+    all_speed = ac.get_supported_wind_speed(mode)
+    speed = SPEED_AUTO if not all_speed or SPEED_AUTO in all_speed else all_speed[
+        0]
+    all_temperature = ac.get_temperature_range(mode)
+    temperature = 26 if not all_temperature or 26 in all_temperature else all_temperature[
+        0]
+    power = POWER_ON if power_on else POWER_OFF
+    return ac.ir_decode_frame(power, temperature, mode, speed)
+
 
 class ConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
     """Handle a config flow for HomeKit."""
@@ -40,41 +72,45 @@ class ConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
     def __init__(self) -> None:
         """Initialize config flow."""
         self.config = {}
+        self._models = {}
 
     async def async_step_user(self, user_input=None):
         """Choose specific domains in bridge mode."""
         errors = {}
 
-        brands = []
-        ac_index = []
-
-        index_file_path = os.path.join(CODES_AB_DIR, "index.json")
-        if not os.path.exists(index_file_path):
+        catalog = get_catalog(self.hass)
+        try:
+            await async_load(self.hass, catalog.refresh)
+        except FileNotFoundError:
             _LOGGER.error("Couldn't find the index json file.")
             return self.async_abort(reason="no_index")
+        except Exception:
+            _LOGGER.error("The index Json file is invalid")
+            return self.async_abort(reason="invalid_index")
 
-        with open(index_file_path) as j:
-            try:
-                ac_index = json.load(j)
-                brands = [brand["brand_name"] for brand in ac_index]
-            except Exception:
-                _LOGGER.error("The index Json file is invalid")
-                return self.async_abort(reason="invalid_index")
-
+        search = ""
         if user_input is not None:
-            self.config.update(user_input)
-            for brand in ac_index:
-                if brand["brand_name"] == user_input[CONF_BRAND]:
-                    self.devices = {
-                        device["bin"]: device["device_name"]
-                        for device in brand["devices"]
-                    }
-                    break
-            return await self.async_step_device()
+            if CONF_BRAND in user_input:
+                self.config[CONF_BRAND] = user_input[CONF_BRAND]
+                self.devices = catalog.usable_devices(user_input[CONF_BRAND])
+                self.labels = {device_file: catalog.label(device_file, name)
+                               for device_file, name in self.devices.items()}
+                return await self.async_step_device()
+            search = user_input.get(CONF_SEARCH, "")
+            if not search:
+                errors[CONF_BRAND] = "no_brand"
+
+        brands = catalog.search(search)
+        if not brands:
+            errors[CONF_SEARCH] = "no_brand_found"
+            brands = catalog.brands
 
         return self.async_show_form(
             step_id="user",
-            data_schema=vol.Schema({vol.Required(CONF_BRAND): vol.In(brands)}),
+            data_schema=vol.Schema({
+                vol.Optional(CONF_SEARCH, default=search): cv.string,
+                vol.Optional(CONF_BRAND): vol.In(brands),
+            }),
             errors=errors,
         )
 
@@ -90,9 +126,11 @@ class ConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
             step_id="device",
             data_schema=vol.Schema(
                 {
-                    vol.Required(CONF_DEVICE): vol.In(self.devices),
+                    vol.Required(CONF_DEVICE): vol.In(self.labels),
                     vol.Required(CONF_CONTROLLER_TYPE, default=ESPHOME_CONTROLLER): vol.In(controllers),
                     vol.Required(CONF_CONTROLLER_DATA): cv.string,
+                    vol.Optional(CONF_PAYLOAD_FORMAT, default=MQTT_FORMAT_JSON): vol.In(MQTT_FORMATS),
+                    vol.Optional(CONF_PULSE_TICK, default=0): TICK_SCHEMA,
                 }
             ),
             # errors=errors,
@@ -128,7 +166,7 @@ class ConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
                 {
                     vol.Required(CONF_OK, default=False): bool,
                     vol.Required(CONF_DEVICE, default=next_device): vol.In(
-                        self.devices
+                        self.labels
                     ),
                     vol.Required(CONF_CONTROLLER_TYPE, default=self.config[CONF_CONTROLLER_TYPE]): vol.In(controllers),
                     vol.Required(
@@ -171,7 +209,7 @@ class ConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
                 {
                     vol.Required(CONF_OK, default=False): bool,
                     vol.Required(CONF_DEVICE, default=next_device): vol.In(
-                        self.devices
+                        self.labels
                     ),
                     vol.Required(CONF_CONTROLLER_TYPE, default=self.config[CONF_CONTROLLER_TYPE]): vol.In(controllers),
                     vol.Required(
@@ -199,6 +237,8 @@ class ConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
                     vol.Optional(CONF_TEMPERATURE_SENSOR): cv.string,
                     vol.Optional(CONF_HUMIDITY_SENSOR): cv.string,
                     vol.Optional(CONF_POWER_SENSOR): cv.string,
+                    vol.Optional(CONF_DEBOUNCE, default=DEFAULT_DEBOUNCE): SECONDS_SCHEMA,
+                    vol.Optional(CONF_FRAME_GAP, default=DEFAULT_FRAME_GAP): SECONDS_SCHEMA,
                 }
             ),
             last_step=True
@@ -215,31 +255,22 @@ class ConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
 
     async def async_test(self, power_on):
         device_file = self.config[CONF_DEVICE]
-        device_bin_path = os.path.join(CODES_AB_DIR, device_file)
-        if not os.path.exists(device_bin_path):
+        try:
+            if device_file not in self._models:
+                self._models[device_file] = await async_load(self.hass, load_ac, device_file)
+            ac = self._models[device_file]
+            raw = await async_load(self.hass, decode_test_frame, ac, power_on)
+        except FileNotFoundError:
             _LOGGER.error(
                 "Couldn't find the device bin file.(%s)", device_file)
             return {CONF_DEVICE: "no_device_file"}
-
-        with open(device_bin_path, "rb") as j:
-            try:
-                ac = AC(j.read())
-                all_modes = ac.get_supported_mode()
-                mode = MODE_AUTO if MODE_AUTO in all_modes else all_modes[0]
-                all_speed = ac.get_supported_wind_speed(mode)
-                speed = SPEED_AUTO if not all_speed or SPEED_AUTO in all_speed else all_speed[
-                    0]
-                all_temperature = ac.get_temperature_range(mode)
-                temperature = 26 if not all_temperature or 26 in all_temperature else all_temperature[
-                    0]
-                power = POWER_ON if power_on else POWER_OFF
-                raw = ac.ir_decode(power, temperature, mode, speed)
-            except Exception:
-                _LOGGER.error("The device bin file is invalid")
-                return {CONF_DEVICE: "invalid_device_file"}
+        except Exception:
+            _LOGGER.error("The device bin file is invalid")
+            return {CONF_DEVICE: "invalid_device_file"}
 
         controller = get_controller(
-            self.hass, self.config[CONF_CONTROLLER_TYPE], self.config[CONF_CONTROLLER_DATA], DEFAULT_DELAY)
+            self.hass, self.config[CONF_CONTROLLER_TYPE], self.config[CONF_CONTROLLER_DATA], DEFAULT_DELAY,
+            self.config.get(CONF_PAYLOAD_FORMAT), self.config.get(CONF_PULSE_TICK))
 
         if not await controller.exist():
             error_map = {ESPHOME_CONTROLLER: "no_such_service",
@@ -247,7 +278,8 @@ class ConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
             return {CONF_CONTROLLER_DATA: error_map.get(self.config[CONF_CONTROLLER_TYPE])}
 
         try:
-            await controller.send(raw)
+            await get_scheduler(self.hass, controller).async_transmit(
+                controller.send, raw, DEFAULT_FRAME_GAP)
             return {}
         except Exception:
             _LOGGER.exception("controller send failed")
@@ -289,6 +321,14 @@ class OptionsFlowHandler(config_entries.OptionsFlow):
                         CONF_CONTROLLER_DATA,
                         default=self.config.get(CONF_CONTROLLER_DATA),
                     ): cv.string,
+                    vol.Optional(
+                        CONF_PAYLOAD_FORMAT,
+                        default=self.config.get(CONF_PAYLOAD_FORMAT, MQTT_FORMAT_JSON),
+                    ): vol.In(MQTT_FORMATS),
+                    vol.Optional(
+                        CONF_PULSE_TICK,
+                        default=self.config.get(CONF_PULSE_TICK, 0),
+                    ): TICK_SCHEMA,
                     vol.Optional(
                         CONF_TEMPERATURE_SENSOR,
                         default=self.config.get(CONF_TEMPERATURE_SENSOR, ""),
@@ -301,6 +341,14 @@ class OptionsFlowHandler(config_entries.OptionsFlow):
                         CONF_POWER_SENSOR,
                         default=self.config.get(CONF_POWER_SENSOR, ""),
                     ): cv.string,
+                    vol.Optional(
+                        CONF_DEBOUNCE,
+                        default=self.config.get(CONF_DEBOUNCE, DEFAULT_DEBOUNCE),
+                    ): SECONDS_SCHEMA,
+                    vol.Optional(
+                        CONF_FRAME_GAP,
+                        default=self.config.get(CONF_FRAME_GAP, DEFAULT_FRAME_GAP),
+                    ): SECONDS_SCHEMA,
                 }
             ),
             # errors=errors,
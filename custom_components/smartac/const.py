@@ -2,13 +2,23 @@
 DOMAIN = "smartac"
 
 DEFAULT_DELAY = 0.5
+DEFAULT_DEBOUNCE = 0.2
+DEFAULT_FRAME_GAP = 0.1
 
 CONF_OK = "ok"
 CONF_MODEL = 'model'
 CONF_BRAND = 'brand'
+CONF_SEARCH = 'search'
 CONF_DEVICE = 'device'
 CONF_CONTROLLER_TYPE = 'controller_type'
 CONF_CONTROLLER_DATA = 'controller_data'
 CONF_TEMPERATURE_SENSOR = 'temperature_sensor'
 CONF_HUMIDITY_SENSOR = 'humidity_sensor'
 CONF_POWER_SENSOR = 'power_sensor'
+CONF_DEBOUNCE = 'debounce'
+CONF_FRAME_GAP = 'frame_gap'
+CONF_PAYLOAD_FORMAT = 'payload_format'
+CONF_PULSE_TICK = 'pulse_tick'
+
+SERVICE_RECEIVE_RAW = 'receive_raw'
+ATTR_COMMAND = 'command'
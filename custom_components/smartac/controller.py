@@ -1,11 +1,15 @@
 from abc import ABC, abstractmethod
+from array import array
 from base64 import b64encode
+from collections import OrderedDict
 import struct
 import logging
 import json
 
 from homeassistant.const import ATTR_ENTITY_ID
 
+from .irext import Frame
+
 _LOGGER = logging.getLogger(__name__)
 
 BROADLINK_CONTROLLER = 'Broadlink'
@@ -13,8 +17,22 @@ XIAOMI_CONTROLLER = 'Xiaomi'
 MQTT_CONTROLLER = 'MQTT'
 ESPHOME_CONTROLLER = 'ESPHome'
 
+PAYLOAD_CACHE_SIZE = 32
+
+# MQTT payload formats
+MQTT_FORMAT_JSON = 'json'
+MQTT_FORMAT_UINT16 = 'uint16'
+MQTT_FORMAT_VARINT = 'varint'
+MQTT_FORMAT_PRONTO = 'pronto'
+MQTT_FORMATS = [MQTT_FORMAT_JSON, MQTT_FORMAT_UINT16, MQTT_FORMAT_VARINT, MQTT_FORMAT_PRONTO]
+
+CARRIER_FREQUENCY = 38000
 
-def get_controller(hass, controller, controller_data, delay):
+# a Broadlink packet repeats its pulses up to 255 more times
+BROADLINK_MAX_REPEAT = 256
+
+
+def get_controller(hass, controller, controller_data, delay, payload_format=MQTT_FORMAT_JSON, pulse_tick=None):
     """Return a controller compatible with the specification provided."""
     controllers = {
         BROADLINK_CONTROLLER: BroadlinkController,
@@ -23,24 +41,180 @@ def get_controller(hass, controller, controller_data, delay):
         ESPHOME_CONTROLLER: ESPHomeController
     }
     try:
-        return controllers[controller](hass, controller, controller_data, delay)
+        controller_class = controllers[controller]
     except KeyError:
         raise Exception("The controller is not supported.")
+    if controller_class is MQTTController:
+        return MQTTController(hass, controller, controller_data, delay, payload_format, pulse_tick=pulse_tick)
+    return controller_class(hass, controller, controller_data, delay, pulse_tick=pulse_tick)
+
+
+def expand(command):
+    """Return the pulses of a command with its repeats written out."""
+    if isinstance(command, Frame):
+        return command.expand()
+    return command
+
+
+def normalize(command, tick=None, max_pulse=None):
+    """Return a command with its pulses merged, quantized and clamped.
+
+    Zero-length pulses are dropped and the pulses around them, which are of
+    the same level, merged. With a tick every pulse is rounded to a multiple
+    of it, of at least one tick. Pulses longer than max_pulse are clamped.
+    """
+    if isinstance(command, Frame):
+        pulses = normalize(command.once(), tick, max_pulse)
+        if max(pulses, default=0) > 0xFFFF:
+            return normalize(command.expand(), tick, max_pulse)
+        return Frame(pulses, command.repeat)
+
+    merged = []
+    last_level = 1
+    for i, pulse in enumerate(command):
+        if not pulse:
+            continue
+        level = i % 2
+        if level == last_level:
+            if merged:
+                merged[-1] += pulse
+            # a leading space sends nothing
+            continue
+        merged.append(pulse)
+        last_level = level
+
+    if tick:
+        merged = [round(max(round(pulse / tick), 1) * tick) for pulse in merged]
+    if max_pulse:
+        merged = [min(pulse, max_pulse) for pulse in merged]
+    return array('I', merged)
+
+
+def pack_uint16(pulses):
+    """Return the base64 of the pulses as little-endian uint16.
+
+    A pulse longer than 65535us is written as a zero followed by its
+    little-endian uint32 duration.
+    """
+    data = bytearray()
+    for pulse in pulses:
+        if pulse > 0xFFFF:
+            data += struct.pack('<HI', 0, pulse)
+        else:
+            data += struct.pack('<H', pulse)
+    return b64encode(data).decode('ascii')
+
+
+def _varint(value):
+    data = bytearray()
+    while value > 0x7F:
+        data.append(value & 0x7F | 0x80)
+        value >>= 7
+    data.append(value)
+    return data
+
+
+def pack_varint(pulses):
+    """Return the base64 of the run-length encoded pulses.
+
+    Each run of identical (mark, space) pairs is written as three LEB128
+    varints: the run length, the mark and the space. A trailing mark without
+    a space is written as a run of one pair with a zero space.
+    """
+    pulses = list(pulses)
+    if len(pulses) % 2:
+        pulses.append(0)
+    data = bytearray()
+    i = 0
+    while i < len(pulses):
+        mark, space = pulses[i], pulses[i + 1]
+        count = 1
+        i += 2
+        while i < len(pulses) and pulses[i] == mark and pulses[i + 1] == space:
+            count += 1
+            i += 2
+        data += _varint(count) + _varint(mark) + _varint(space)
+    return b64encode(data).decode('ascii')
+
+
+def pack_pronto(pulses, frequency=CARRIER_FREQUENCY):
+    """Return the pulses as a Pronto hex learned code without a repeat sequence."""
+    pulses = list(pulses)
+    if len(pulses) % 2:
+        # a burst pair needs a space, end with a short one
+        pulses.append(pulses[-1])
+    words = [0, int(1000000 / (frequency * 0.241246)), len(pulses) // 2, 0]
+    words += [min(max(round(pulse * frequency / 1000000), 1), 0xFFFF) for pulse in pulses]
+    return ' '.join('%04X' % word for word in words)
 
 
 class AbstractController(ABC):
     """Representation of a controller."""
-    def __init__(self, hass, controller, controller_data, delay):
+
+    # resolution of the transmitter in microseconds, None when it takes any duration
+    pulse_tick = None
+    # longest pulse the transmitter can send in microseconds
+    max_pulse = None
+
+    def __init__(self, hass, controller, controller_data, delay, pulse_tick=None):
         self.hass = hass
         self._controller = controller
         self._controller_data = controller_data
         self._delay = delay
+        if pulse_tick:
+            self.pulse_tick = pulse_tick
+        self._payloads = OrderedDict()
+        self.payload_hits = 0
+        self.payload_misses = 0
+
+    @property
+    def transmitter(self):
+        """Return the key of the physical transmitter this controller sends to."""
+        return (self._controller, self._controller_data)
 
     @abstractmethod
-    async def send(self, command):
-        """Send a command."""
+    async def send(self, command, key=None):
+        """Send a command, an array of pulse durations in microseconds.
+
+        Commands sent with the same key are encoded only once. The command may
+        be a function returning it instead, called only when its payload isn't
+        cached.
+        """
         pass
 
+    def encode(self, command):
+        """Return the payload a command is sent as."""
+        return expand(command).tolist()
+
+    def normalize(self, command):
+        """Return a command fitted to the resolution and range of the transmitter."""
+        return normalize(command, self.pulse_tick, self.max_pulse)
+
+    def payload(self, command, key=None):
+        """Return the normalized and encoded command, from the payload cache when it has a key."""
+        if key is None:
+            return self.encode(self.normalize(command() if callable(command) else command))
+
+        payload = self._payloads.get(key)
+        if payload is not None:
+            self._payloads.move_to_end(key)
+            self.payload_hits += 1
+        else:
+            payload = self.encode(self.normalize(command() if callable(command) else command))
+            self._payloads[key] = payload
+            if len(self._payloads) > PAYLOAD_CACHE_SIZE:
+                self._payloads.popitem(last=False)
+            self.payload_misses += 1
+        _LOGGER.debug("Payload cache hit rate %.0f%% (%d hits, %d misses)",
+                      self.payload_hit_rate * 100, self.payload_hits, self.payload_misses)
+        return payload
+
+    @property
+    def payload_hit_rate(self):
+        """Return the share of keyed sends served from the payload cache."""
+        total = self.payload_hits + self.payload_misses
+        return self.payload_hits / total if total else 0.0
+
     @abstractmethod
     async def exist(self):
         return True
@@ -49,11 +223,15 @@ class AbstractController(ABC):
 class BroadlinkController(AbstractController):
     """Controls a Broadlink device."""
 
+    # raw2broadlink writes pulses in ticks of 8192/269us, up to 65535 of them
+    pulse_tick = 8192 / 269
+    max_pulse = 0xFFFF * 8192 // 269
+
     def raw2broadlink(self, pulses):
         array = bytearray()
 
         for pulse in pulses:
-            pulse = int(pulse * 269 / 8192)
+            pulse = round(pulse * 269 / 8192)
 
             if pulse < 256:
                 array += bytearray(struct.pack('>B', pulse))
@@ -72,20 +250,25 @@ class BroadlinkController(AbstractController):
             packet += bytearray(16 - remainder)
         return packet
 
-    async def send(self, command):
-        """Send a command."""
-        command = self.raw2broadlink(command)
-        command = b64encode(command).decode('utf-8')
-        commands = ['b64:' + command]
+    def encode(self, command):
+        """Return the base64 Broadlink packet of a command, repeated by the remote."""
+        if isinstance(command, Frame) and 1 < command.repeat <= BROADLINK_MAX_REPEAT:
+            packet = self.raw2broadlink(command.once())
+            packet[1] = command.repeat - 1
+        else:
+            packet = self.raw2broadlink(expand(command))
+        return 'b64:' + b64encode(packet).decode('utf-8')
 
+    async def send(self, command, key=None):
+        """Send a command."""
         service_data = {
             ATTR_ENTITY_ID: self._controller_data,
-            'command':  commands,
+            'command':  [self.payload(command, key)],
             'delay_secs': self._delay
         }
         
         await self.hass.services.async_call(
-            'remote', 'send_command', service_data)
+            'remote', 'send_command', service_data, blocking=True)
 
     async def exist(self):
         return self.hass.states.get(self._controller_data) is not None
@@ -94,7 +277,7 @@ class BroadlinkController(AbstractController):
 class XiaomiController(AbstractController):
     """Controls a Xiaomi device."""
 
-    async def send(self, command):
+    async def send(self, command, key=None):
         """Send a command."""
         service_data = {
             ATTR_ENTITY_ID: self._controller_data,
@@ -102,21 +285,37 @@ class XiaomiController(AbstractController):
         }
 
         await self.hass.services.async_call(
-            'remote', 'send_command', service_data)
+            'remote', 'send_command', service_data, blocking=True)
 
 
 class MQTTController(AbstractController):
     """Controls a MQTT device."""
 
-    async def send(self, command):
+    def __init__(self, hass, controller, controller_data, delay, payload_format=MQTT_FORMAT_JSON,
+                 pulse_tick=None):
+        super().__init__(hass, controller, controller_data, delay, pulse_tick)
+        self._payload_format = payload_format or MQTT_FORMAT_JSON
+
+    def encode(self, command):
+        """Return the payload of a command in the configured format."""
+        command = expand(command)
+        if self._payload_format == MQTT_FORMAT_UINT16:
+            return pack_uint16(command)
+        if self._payload_format == MQTT_FORMAT_VARINT:
+            return pack_varint(command)
+        if self._payload_format == MQTT_FORMAT_PRONTO:
+            return pack_pronto(command)
+        return json.dumps(command.tolist())
+
+    async def send(self, command, key=None):
         """Send a command."""
         service_data = {
             'topic': self._controller_data,
-            'payload': json.dumps(command)
+            'payload': self.payload(command, key)
         }
 
         await self.hass.services.async_call(
-            'mqtt', 'publish', service_data)
+            'mqtt', 'publish', service_data, blocking=True)
     
     async def exist(self):
         return self.hass.services.has_service('mqtt', 'publish')
@@ -124,22 +323,39 @@ class MQTTController(AbstractController):
 
 class ESPHomeController(AbstractController):
     """Controls a ESPHome device."""
-    def __init__(self, hass, controller, controller_data, delay):
-        super().__init__(hass, controller, controller_data, delay)
+
+    # transmit_raw takes int32 durations
+    max_pulse = 0x7FFFFFFF
+
+    def __init__(self, hass, controller, controller_data, delay, pulse_tick=None):
+        super().__init__(hass, controller, controller_data, delay, pulse_tick)
         self._controller_data = controller_data if '.' not in controller_data else controller_data.split('.')[1]
+        # whether the service takes a repeat variable, looked up on the first send
+        self._native_repeat = None
     
-    async def send(self, command):
-        raw = []
-        for i in range(0, len(command)):
-            if i % 2 == 0:
-                raw.append(command[i])
-            else:
-                raw.append(-command[i])
+    def encode(self, command):
+        """Return the service variables of a command, with negative durations for the spaces."""
+        variables = {}
+        if self._native_repeat:
+            variables['repeat'] = command.repeat if isinstance(command, Frame) else 1
+            if isinstance(command, Frame):
+                command = command.once()
+        raw = expand(command).tolist()
+        for i in range(1, len(raw), 2):
+            raw[i] = -raw[i]
+        variables['command'] = raw
+        return variables
+
+    async def send(self, command, key=None):
+        if self._native_repeat is None:
+            service = self.hass.services.async_services().get('esphome', {}).get(self._controller_data)
+            schema = getattr(service, 'schema', None)
+            self._native_repeat = schema is not None and 'repeat' in schema.schema
 
-        service_data = {'command':  raw}
+        service_data = dict(self.payload(command, key))
 
         await self.hass.services.async_call(
-            'esphome', self._controller_data, service_data)
+            'esphome', self._controller_data, service_data, blocking=True)
     
     async def exist(self):
         return self.hass.services.has_service('esphome', self._controller_data)
@@ -1,3 +1,13 @@
+from array import array
+from collections.abc import Sequence
+from functools import cached_property, lru_cache
+import struct
+
+try:
+    import numpy as np
+except ImportError:  # optional, ir_decode_batch decodes one frame at a time without it
+    np = None
+
 TAG_AC_BOOT_CODE = 1
 TAG_AC_ZERO = 2
 TAG_AC_ONE = 3
@@ -75,177 +85,427 @@ SWING_ON = 0
 SWING_OFF = 1
 swing_modes = [SWING_ON, SWING_OFF]
 
+# frames hold uint16 durations, longer boot, zero and one codes are clamped
+MAX_PULSE = 0xFFFF
+
+
+@lru_cache(maxsize=64)
+def _pulse_table(bit_num, endian, zero, one, delay):
+    """Return the packed pulses of every byte value sent with bit_num bits."""
+    table = [()]
+    for _ in range(0, bit_num):
+        if endian == 0:
+            # most significant bit first
+            table = [table[v >> 1] + (one if v & 1 else zero)
+                     for v in range(0, len(table) * 2)]
+        else:
+            table = [(one if v & 1 else zero) + table[v >> 1]
+                     for v in range(0, len(table) * 2)]
+    mask = len(table) - 1
+    return [array('H', table[v & mask] + delay).tobytes() for v in range(0, 256)]
+
+
+def _type_1_masks(data):
+    # (byte position, bits kept, bits set)
+    return [(data[i], 0x00, data[i + 1]) for i in range(0, len(data), 2)]
+
+
+def _type_2_masks(data):
+    masks = []
+    for i in range(0, len(data), 3):
+        start_bit = data[i]
+        end_bit = data[i+1]
+        bit_range = end_bit - start_bit
+        raw_value = data[i+2]
+        cover_byte_pos_hi = start_bit >> 3
+        cover_byte_pos_lo = (end_bit - 1) >> 3
+        int_start_bit = start_bit - (cover_byte_pos_hi << 3)
+        int_end_bit = end_bit - (cover_byte_pos_lo << 3)
+        if cover_byte_pos_hi == cover_byte_pos_lo:
+            mask = ((0xFF << (8 - int_start_bit))
+                    | (0xFF >> int_end_bit)) % 256
+            masks.append((cover_byte_pos_lo, mask,
+                          (raw_value << (8 - int_start_bit - bit_range)) & ~mask & 0xFF))
+        else:
+            value = (0xFF >> (8 - bit_range)) & raw_value
+            masks.append((cover_byte_pos_hi, (0xFF << (8 - int_start_bit)) & 0xFF,
+                          (value >> int_end_bit) & 0xFF))
+            masks.append((cover_byte_pos_lo, 0xFF >> int_end_bit,
+                          (value << (8 - int_end_bit)) & 0xFF))
+    return masks
+
+
+# plans carry their parameters in a vector attribute for ir_decode_batch
+def _masks_plan(masks):
+    def apply(ir_hex):
+        for pos, keep, bits in masks:
+            ir_hex[pos] = (ir_hex[pos] & keep) | bits
+    apply.vector = ('masks', masks)
+    return apply
+
+
+def _add_plan(steps):
+    def apply(ir_hex):
+        for pos, step in steps:
+            ir_hex[pos] = (ir_hex[pos] + step) % 256
+    apply.vector = ('add', steps)
+    return apply
+
+
+_BYTE_VALUE = tuple(range(0, 256))
+_NIBBLE_SUM = tuple((value >> 4) + (value & 0x0F) for value in range(0, 256))
+
+
+def _checksum_plan(checksum):
+    """Return a function computing and writing a checksum into a frame."""
+    checksum_type = checksum['type']
+    checksum_plus = checksum['checksum_plus']
+    checksum_byte_pos = checksum['checksum_byte_pos']
+    inverse = checksum_type in (CHECKSUM_TYPE_BYTE_INVERSE, CHECKSUM_TYPE_HALF_BYTE_INVERSE,
+                                CHECKSUM_TYPE_SPEC_HALF_BYTE_INVERSE, CHECKSUM_TYPE_SPEC_HALF_BYTE_INVERSE_ONE_BYTE)
+
+    if checksum_type <= CHECKSUM_TYPE_HALF_BYTE_INVERSE:
+        positions = tuple(range(checksum['start_byte_pos'], checksum['end_byte_pos']))
+        weights = _BYTE_VALUE if checksum_type <= CHECKSUM_TYPE_BYTE_INVERSE else _NIBBLE_SUM
+
+        def apply(ir_hex):
+            value = (sum([weights[ir_hex[i]] for i in positions]) + checksum_plus) % 256
+            ir_hex[checksum_byte_pos] = 255 - value if inverse else value
+        apply.vector = ('sum', positions, weights is _NIBBLE_SUM, checksum_plus, inverse, checksum_byte_pos)
+        return apply
+
+    # spec half byte: even positions are high nibbles, odd ones low nibbles
+    high = tuple(pos >> 1 for pos in checksum['spec_pos'] if not pos & 0x01)
+    low = tuple(pos >> 1 for pos in checksum['spec_pos'] if pos & 0x01)
+    apply_byte_pos = checksum_byte_pos >> 1
+    one_byte = checksum_type >= CHECKSUM_TYPE_SPEC_HALF_BYTE_ONE_BYTE
+    high_nibble = not checksum_byte_pos & 0x01
+
+    def apply(ir_hex):
+        value = sum([ir_hex[i] >> 4 for i in high]) + sum([ir_hex[i] & 0x0F for i in low])
+        value = (value + checksum_plus) % 256
+        if inverse:
+            value = 255 - value
+        if one_byte:
+            ir_hex[apply_byte_pos] = value
+        elif high_nibble:
+            ir_hex[apply_byte_pos] = ((ir_hex[apply_byte_pos] & 0x0F) | (value << 4)) % 256
+        else:
+            ir_hex[apply_byte_pos] = (ir_hex[apply_byte_pos] & 0xF0) | (value & 0x0F)
+    apply.vector = ('spec', high, low, checksum_plus, inverse, apply_byte_pos, one_byte, high_nibble)
+    return apply
+
+
+class Frame(array):
+    """The pulses of a frame sent repeat times, each copy followed by a gap space.
+
+    The gap is the trailing space of the decoded frame, split off so that
+    transmitters with a native repeat can be given a single copy.
+    """
+
+    def __new__(cls, pulses=(), repeat=1):
+        return super().__new__(cls, 'H', pulses)
+
+    def __init__(self, pulses=(), repeat=1):
+        self.repeat = repeat
+        self.gap = 0
+        if repeat > 1 and len(self) % 2 == 0 and len(self):
+            self.gap = self.pop()
+
+    def once(self):
+        """Return the pulses of one copy, followed by the gap."""
+        pulses = array('H', self)
+        if self.gap:
+            pulses.append(self.gap)
+        return pulses
+
+    def expand(self):
+        """Return the pulses of every copy."""
+        if self.repeat == 1:
+            return self
+        return self.once() * self.repeat
+
+
+def _apply_rows(codes, rows, plan):
+    """Apply a plan to some rows of a matrix of byte frames."""
+    vector = getattr(plan, 'vector', None)
+    if vector is None:
+        # the result only depends on the frame, run the plan once per distinct frame
+        block = codes[rows]
+        order = np.lexsort(block.T[::-1])
+        block = block[order]
+        first = np.ones(len(block), dtype=bool)
+        first[1:] = (block[1:] != block[:-1]).any(axis=1)
+        frames = block[first]
+        for frame in frames:
+            ir_hex = bytearray(frame.tobytes())
+            plan(ir_hex)
+            frame[:] = np.frombuffer(ir_hex, dtype=np.uint8)
+        codes[rows[order]] = frames[np.cumsum(first) - 1]
+        return
+
+    kind = vector[0]
+    if kind == 'masks':
+        for pos, keep, bits in vector[1]:
+            codes[rows, pos] = (codes[rows, pos] & keep) | bits
+    elif kind == 'add':
+        for pos, step in vector[1]:
+            codes[rows, pos] = (codes[rows, pos].astype(np.int64) + step) % 256
+    elif kind == 'sum':
+        positions, nibbles, plus, inverse, pos = vector[1:]
+        block = codes[rows][:, list(positions)].astype(np.int64)
+        if nibbles:
+            block = (block >> 4) + (block & 0x0F)
+        value = (block.sum(axis=1) + plus) % 256
+        codes[rows, pos] = 255 - value if inverse else value
+    else:
+        high, low, plus, inverse, pos, one_byte, high_nibble = vector[1:]
+        frames = codes[rows].astype(np.int64)
+        value = (frames[:, list(high)] >> 4).sum(axis=1) + (frames[:, list(low)] & 0x0F).sum(axis=1)
+        value = (value + plus) % 256
+        if inverse:
+            value = 255 - value
+        if one_byte:
+            codes[rows, pos] = value
+        elif high_nibble:
+            codes[rows, pos] = ((codes[rows, pos] & 0x0F) | (value << 4)) % 256
+        else:
+            codes[rows, pos] = (codes[rows, pos] & 0xF0) | (value & 0x0F)
+
+
+class _DynamicTemperature(Sequence):
+    """The 15 temperature segments of a dynamic temperature tag, built on first access.
+
+    Segment i adds i times the step of every position of the tag.
+    """
+
+    def __init__(self, data, width):
+        self._data = data
+        # 2 for type 1 (pos, step) items, 3 for type 2 (start, end, step)
+        self._width = width
+        self._segments = [None] * 15
+
+    def __len__(self):
+        return 15
+
+    def __getitem__(self, index):
+        segment = self._segments[index]
+        if segment is None:
+            segment = self._segments[index] = self._segment(range(0, 15)[index])
+        return segment
+
+    def _segment(self, index):
+        data = self._data
+        seg_len = data[0]
+        segment = []
+        if self._width == 2:
+            for i in range(1, seg_len, 2):
+                segment.append(data[i])
+                segment.append(data[i+1]*index)
+        else:
+            for i in range(2, seg_len, 3):
+                segment.append(data[i-1])
+                segment.append(data[i])
+                segment.append(data[i+1]*index)
+        return segment
+
 
 class AC:
 
     def __init__(self, data) -> None:
-
+        # tags are views of the bin, each parsed on first use
+        data = memoryview(data)
         tag_count = data[0]  # must be 29
 
-        data = data[1:]
-        offsets = []
-        for i in range(0, tag_count):
-            offsets.append(int.from_bytes(
-                data[i*2:i*2+2], "little", signed=False))
+        offsets = struct.unpack_from('<%dH' % tag_count, data, 1)
 
-        data = data[tag_count * 2:]
+        data = data[1 + tag_count * 2:]
         tags_data = {}
-        for i in range(0, tag_count):
+        # a tag ends where the next present tag starts
+        end = len(data)
+        for i in range(tag_count - 1, -1, -1):
             if offsets[i] == 0xffff:
-                tags_data[tags[i]] = b''
+                tags_data[tags[i]] = data[0:0]
                 continue
-            for j in range(i + 1, tag_count + 1):
-                if j == tag_count:
-                    tags_data[tags[i]] = data[offsets[i]:]
-                    break
-                if offsets[j] != 0xffff:
-                    tags_data[tags[i]] = data[offsets[i]:offsets[j]]
-                    break
+            tags_data[tags[i]] = data[offsets[i]:end]
+            end = offsets[i]
 
         self._tags = tags_data
+        # tags with durations clamped to MAX_PULSE, filled as they are parsed
+        self.clamped_tags = set()
 
-        # '0' = no, '1' = swing only, '1,2,3'=normal  , ''=normal & mode=2 & enable swing1 swing2
-        self._swing_mode = tags_data[TAG_AC_SWING_INFO].decode()
-        self._swing1 = self._parse_data(tags_data.get(TAG_AC_SWING_1).decode())
-        self._swing2 = self._parse_data(tags_data.get(TAG_AC_SWING_2).decode())
-        self._mode1 = self._parse_data(tags_data.get(TAG_AC_MODE_1).decode())
-        self._mode2 = self._parse_data(tags_data.get(TAG_AC_MODE_2).decode())
-        self._power1 = self._parse_data(tags_data.get(TAG_AC_POWER_1).decode())
-
-        # default code
-        default_code = bytes.fromhex(
-            tags_data.get(TAG_AC_DEFAULT_CODE).decode())
-        self._default_code = default_code[1:default_code[0] + 1]
-
-        self._n_mode = []
-        # 'NA' = disable, 'S'or's' = all speed, 'T'or't'=all temp, '&16,17,18'>disable 16,17,18
-        self._n_mode.append(self._parse_n_mode(
-            tags_data[TAG_AC_BAN_FUNCTION_IN_COOL_MODE].decode()))
-        self._n_mode.append(self._parse_n_mode(
-            tags_data[TAG_AC_BAN_FUNCTION_IN_HEAT_MODE].decode()))
-        self._n_mode.append(self._parse_n_mode(
-            tags_data[TAG_AC_BAN_FUNCTION_IN_AUTO_MODE].decode()))
-        self._n_mode.append(self._parse_n_mode(
-            tags_data[TAG_AC_BAN_FUNCTION_IN_FAN_MODE].decode()))
-        self._n_mode.append(self._parse_n_mode(
-            tags_data[TAG_AC_BAN_FUNCTION_IN_DRY_MODE].decode()))
-
-        # temp1
-        temp1_hex = tags_data.get(TAG_AC_TEMP_1).decode()
-        self._temp1 = []
-        if temp1_hex != '':
-            temp1_data = bytes.fromhex(temp1_hex)
-            seg_len = temp1_data[0]
-            if seg_len != len(temp1_data) - 1:
-                self._temp1_type = 'static'
-                self._temp1 = self._parse_data(temp1_hex)
-            else:
-                self._temp1_type = 'dynamic'
-                for index in range(0, 15):
-                    segment = []
-                    for i in range(1, seg_len, 2):
-                        segment.append(temp1_data[i])
-                        segment.append(temp1_data[i+1]*index)
-                    self._temp1.append(segment)
-        # temp1
-
-        # temp2
-        temp2_hex = tags_data.get(TAG_AC_TEMP_2).decode()
-        self._temp2 = []
-        if temp2_hex != '':
-            temp2_data = bytes.fromhex(temp2_hex)
-            seg_len = temp2_data[0]
-            if seg_len != len(temp2_data) - 1:
-                self._temp2_type = 'static'
-                self._temp2 = self._parse_data(temp2_hex)
-            else:
-                self._temp2_type = 'dynamic'
-                for index in range(0, 15):
-                    segment = []
-                    for i in range(2, seg_len, 3):
-                        segment.append(temp2_data[i-1])
-                        segment.append(temp2_data[i])
-                        segment.append(temp2_data[i+1]*index)
-                    self._temp2.append(segment)
-        # temp2 end
-
-        self._speed1 = self._parse_data(tags_data.get(TAG_AC_SPEED_1).decode())
-        self._speed2 = self._parse_data(tags_data.get(TAG_AC_SPEED_2).decode())
-
-        # funtion1
-        self._function1 = {}
-        function1_hex = tags_data.get(TAG_AC_FUNCTION_1).decode()
-        function1_parsed = self._parse_data(function1_hex)
-        for f in function1_parsed:
-            self._function1[f[0]] = f[1:]
-        # function1 end
-
-        # function2
-        self._function2 = {}
-        function2_hex = tags_data.get(TAG_AC_FUNCTION_2).decode()
-        function2_parsed = self._parse_data(function2_hex)
-        for f in function2_parsed:
-            self._function2[f[0]] = f[1:]
-        # function2 end
-
-        self._solo_function = set()
-        # [len][function1][function2]
-        solo_function_hex = tags_data.get(TAG_AC_SOLO_FUNCTION).decode()
+        # plans and tables are compiled on the first decode
+        self._byte_tables = None
+        self._batch_layout = None
+
+    def _text(self, tag):
+        return str(self._tags[tag], 'utf-8')
+
+    # '0' = no, '1' = swing only, '1,2,3'=normal  , ''=normal & mode=2 & enable swing1 swing2
+    @cached_property
+    def _swing_mode(self):
+        return self._text(TAG_AC_SWING_INFO)
+
+    @cached_property
+    def _swing1(self):
+        return self._parse_data(self._text(TAG_AC_SWING_1))
+
+    @cached_property
+    def _swing2(self):
+        return self._parse_data(self._text(TAG_AC_SWING_2))
+
+    @cached_property
+    def _mode1(self):
+        return self._parse_data(self._text(TAG_AC_MODE_1))
+
+    @cached_property
+    def _mode2(self):
+        return self._parse_data(self._text(TAG_AC_MODE_2))
+
+    @cached_property
+    def _power1(self):
+        return self._parse_data(self._text(TAG_AC_POWER_1))
+
+    @cached_property
+    def _default_code(self):
+        default_code = bytes.fromhex(self._text(TAG_AC_DEFAULT_CODE))
+        return default_code[1:default_code[0] + 1]
+
+    # 'NA' = disable, 'S'or's' = all speed, 'T'or't'=all temp, '&16,17,18'>disable 16,17,18
+    @cached_property
+    def _n_mode(self):
+        return [self._parse_n_mode(self._text(tag)) for tag in (
+            TAG_AC_BAN_FUNCTION_IN_COOL_MODE,
+            TAG_AC_BAN_FUNCTION_IN_HEAT_MODE,
+            TAG_AC_BAN_FUNCTION_IN_AUTO_MODE,
+            TAG_AC_BAN_FUNCTION_IN_FAN_MODE,
+            TAG_AC_BAN_FUNCTION_IN_DRY_MODE)]
+
+    @cached_property
+    def _temp1_type(self):
+        return self._temp_type(TAG_AC_TEMP_1)
+
+    @cached_property
+    def _temp1(self):
+        return self._parse_temp(TAG_AC_TEMP_1, self._temp1_type, 2)
+
+    @cached_property
+    def _temp2_type(self):
+        return self._temp_type(TAG_AC_TEMP_2)
+
+    @cached_property
+    def _temp2(self):
+        return self._parse_temp(TAG_AC_TEMP_2, self._temp2_type, 3)
+
+    def _temp_type(self, tag):
+        temp_hex = self._text(tag)
+        if temp_hex == '':
+            return None
+        temp_data = bytes.fromhex(temp_hex)
+        return 'dynamic' if temp_data[0] == len(temp_data) - 1 else 'static'
+
+    def _parse_temp(self, tag, temp_type, width):
+        if temp_type is None:
+            return []
+        if temp_type == 'static':
+            return self._parse_data(self._text(tag))
+        return _DynamicTemperature(bytes.fromhex(self._text(tag)), width)
+
+    @cached_property
+    def _speed1(self):
+        return self._parse_data(self._text(TAG_AC_SPEED_1))
+
+    @cached_property
+    def _speed2(self):
+        return self._parse_data(self._text(TAG_AC_SPEED_2))
+
+    @cached_property
+    def _function1(self):
+        return {f[0]: f[1:] for f in self._parse_data(self._text(TAG_AC_FUNCTION_1))}
+
+    @cached_property
+    def _function2(self):
+        return {f[0]: f[1:] for f in self._parse_data(self._text(TAG_AC_FUNCTION_2))}
+
+    # [len][function1][function2]
+    @cached_property
+    def _solo_function(self):
+        solo_function_hex = self._text(TAG_AC_SOLO_FUNCTION)
         if len(solo_function_hex) >= 4:
-            self._solo_function = {
-                int(func) for func in bytes.fromhex(solo_function_hex)[1:]}
+            return {int(func) for func in bytes.fromhex(solo_function_hex)[1:]}
+        return set()
 
-        self._frame_len = tags_data.get(TAG_AC_FRAME_LENGTH).decode()
+    @cached_property
+    def _frame_len(self):
+        return self._text(TAG_AC_FRAME_LENGTH)
 
-        self._zero = []
-        for time in tags_data.get(TAG_AC_ZERO).decode().split(','):
-            if time:
-                self._zero.append(int(time))
+    @cached_property
+    def _zero(self):
+        return self._parse_times(TAG_AC_ZERO)
 
-        self._one = []
-        for time in tags_data.get(TAG_AC_ONE).decode().split(','):
-            if time:
-                self._one.append(int(time))
+    @cached_property
+    def _one(self):
+        return self._parse_times(TAG_AC_ONE)
 
-        self._boot_code = []
-        for time in tags_data.get(TAG_AC_BOOT_CODE).decode().split(','):
-            if time:
-                self._boot_code.append(int(time))
+    @cached_property
+    def _boot_code(self):
+        return self._parse_times(TAG_AC_BOOT_CODE)
 
-        self._repeat_time = 1
-        if tags_data.get(TAG_AC_REPEAT_TIMES):
-            self._repeat_time = int(
-                tags_data.get(TAG_AC_REPEAT_TIMES).decode())
+    def _parse_times(self, tag):
+        times = [int(time) for time in self._text(tag).split(',') if time]
+        if any(time > MAX_PULSE for time in times):
+            self.clamped_tags.add(tag)
+            times = [min(time, MAX_PULSE) for time in times]
+        return times
 
-        self._bit_num = []
-        for sub in tags_data.get(TAG_AC_BIT_NUM).decode().split('|'):
+    @cached_property
+    def _repeat_time(self):
+        if self._tags.get(TAG_AC_REPEAT_TIMES):
+            return int(self._text(TAG_AC_REPEAT_TIMES))
+        return 1
+
+    @cached_property
+    def _bit_num(self):
+        bit_num = []
+        for sub in self._text(TAG_AC_BIT_NUM).split('|'):
             item = sub.split('&')
             if len(item) < 2:
                 continue
             pos = int(item[0])
             if pos == -1:
                 pos = len(self._default_code) - 1
-            self._bit_num.append({'pos': pos, 'bits': int(item[1])})
+            bit_num.append({'pos': pos, 'bits': int(item[1])})
+        return bit_num
 
-        self._endian = 0
-        if tags_data.get(TAG_AC_ENDIAN):
-            self._endian = int(tags_data.get(TAG_AC_ENDIAN).decode())
+    @cached_property
+    def _endian(self):
+        if self._tags.get(TAG_AC_ENDIAN):
+            return int(self._text(TAG_AC_ENDIAN))
+        return 0
 
-        # delay code
-        self._delay = []
-        for sub in tags_data.get(TAG_AC_DELAY_CODE).decode().split('|'):
+    # delay code
+    @cached_property
+    def _delay(self):
+        delays = []
+        for sub in self._text(TAG_AC_DELAY_CODE).split('|'):
             delay = sub.split('&')
             if len(delay) < 2:
                 continue
-            self._delay.append({'pos': int(delay[0]), 'time': [
-                               int(t) % 65536 for t in delay[1].split(',')]})
+            delays.append({'pos': int(delay[0]), 'time': [
+                          int(t) % 65536 for t in delay[1].split(',')]})
+        return delays
 
-        self._last_bit = int(tags_data.get(TAG_AC_LAST_BIT).decode()) if tags_data.get(
-            TAG_AC_LAST_BIT) else 0
-        # delay code end
+    @cached_property
+    def _last_bit(self):
+        if self._tags.get(TAG_AC_LAST_BIT):
+            return int(self._text(TAG_AC_LAST_BIT))
+        return 0
+    # delay code end
 
-        self._checksum = []
-        for t_hex in tags_data.get(TAG_AC_CHECKSUM_TYPE).decode().split('|'):
+    @cached_property
+    def _checksum(self):
+        checksums = []
+        for t_hex in self._text(TAG_AC_CHECKSUM_TYPE).split('|'):
             checksum_data = bytes.fromhex(t_hex)
             if len(checksum_data) <= 1:
                 continue
@@ -263,122 +523,174 @@ class AC:
                 checksum['checksum_byte_pos'] = checksum_data[2]
                 checksum['checksum_plus'] = checksum_data[3]
                 checksum['spec_pos'] = checksum_data[4:]
-            self._checksum.append(checksum)
+            checksums.append(checksum)
+        return checksums
 
     def ir_decode(self, power, temperature, mode, speed, swing=SWING_ON, dir=0, function_code=1):
+        return self.ir_decode_frame(power, temperature, mode, speed, swing, dir, function_code).expand()
+
+    def ir_decode_frame(self, power, temperature, mode, speed, swing=SWING_ON, dir=0, function_code=1):
+        """Return a single copy of the frame, with the repeat count and the gap between copies."""
+        ir_hex = self.ir_decode_bytes(power, temperature, mode, speed, swing, dir, function_code)
+        raw = bytearray(self._head_pulses)
+        for pulses, value in zip(self._byte_tables, ir_hex):
+            raw += pulses[value]
+        raw += self._tail_pulses
+        # for i in range(1, len(ir_raw), 2):
+        #     ir_raw[i] = -ir_raw[i]
+        return Frame(raw, self._repeat_time)
+
+    def ir_decode_bytes(self, power, temperature, mode, speed, swing=SWING_ON, dir=0, function_code=1):
+        """Return the byte frame of a state, checksums included."""
+        if self._byte_tables is None:
+            self._compile()
         ir_hex = bytearray(self._default_code)
-        # apply power
-        if len(self._power1) > power:
-            ir_hex = self._apply_type_1(ir_hex, self._power1[power])
-        if power == POWER_ON:
-            # apply mode:
-            if AC_FUNCTION_MODE not in self._solo_function:
-                if self._mode1:
-                    ir_hex = self._apply_type_1(ir_hex, self._mode1[mode])
-                elif self._mode2:
-                    ir_hex = self._apply_type_2(ir_hex, self._mode2[mode])
-            # apply speed
-            if AC_FUNCTION_WIND_SPEED not in self._solo_function:
-                if self._speed1:
-                    ir_hex = self._apply_type_1(ir_hex, self._speed1[speed])
-                elif self._speed2:
-                    ir_hex = self._apply_type_2(ir_hex, self._speed2[speed])
-            # apply swing
-            if AC_FUNCTION_WIND_SWING not in self._solo_function and AC_FUNCTION_WIND_FIX not in self._solo_function:
-                if self._swing1:
-                    ir_hex = self._apply_type_1(ir_hex, self._swing1[swing])
-                elif self._swing2:
-                    ir_hex = self._apply_type_2(ir_hex, self._swing2[swing])
-            # apply temperature
-            if AC_FUNCTION_TEMPERATURE_UP not in self._solo_function and AC_FUNCTION_TEMPERATURE_DOWN not in self._solo_function:
-                if self._temp1:
-                    ir_hex = self._apply_type_1(
-                        ir_hex, self._temp1[temperature - 16], self._temp1_type == 'dynamic')
-                elif self._temp2:
-                    ir_hex = self._apply_type_2(
-                        ir_hex, self._temp2[temperature - 16], self._temp2_type == 'dynamic')
-        # apply function
-        if function_code in self._function1:
-            ir_hex = self._apply_type_1(ir_hex, self._function1[function_code])
-        elif function_code in self._function2:
-            ir_hex = self._apply_type_2(ir_hex, self._function2[function_code])
+        for plan in self._field_steps(power, temperature, mode, speed, swing, function_code):
+            if plan is not None:
+                plan(ir_hex)
         # aplly checksum
-        for checksum in self._checksum:
-            value = 0
-            if checksum['type'] == CHECKSUM_TYPE_BYTE or checksum['type'] == CHECKSUM_TYPE_BYTE_INVERSE:
-                for i in range(checksum['start_byte_pos'], checksum['end_byte_pos']):
-                    value += ir_hex[i]
-                value += checksum['checksum_plus']
-                value %= 256
-                value = ~value + \
-                    256 if checksum['type'] == CHECKSUM_TYPE_BYTE_INVERSE else value
-                ir_hex[checksum['checksum_byte_pos']] = value % 256
-            elif checksum['type'] == CHECKSUM_TYPE_HALF_BYTE or checksum['type'] == CHECKSUM_TYPE_HALF_BYTE_INVERSE:
-                for i in range(checksum['start_byte_pos'], checksum['end_byte_pos']):
-                    value += (ir_hex[i] >> 4) + (ir_hex[i] & 0x0F)
-                value += checksum['checksum_plus']
-                value %= 256
-                value = ~value + \
-                    256 if checksum['type'] == CHECKSUM_TYPE_HALF_BYTE_INVERSE else value
-                ir_hex[checksum['checksum_byte_pos']] = value % 256
-            elif checksum['type'] == CHECKSUM_TYPE_SPEC_HALF_BYTE or checksum['type'] == CHECKSUM_TYPE_SPEC_HALF_BYTE_INVERSE:
-                if not 'spec_pos' in checksum:
-                    continue
-                for pos in checksum['spec_pos']:
-                    byte_pos = pos >> 1
-                    value += ir_hex[byte_pos] >> 4 if 0 == (
-                        pos & 0x01) else ir_hex[byte_pos] & 0x0F
-                value += checksum['checksum_plus']
-                value %= 256
-                value = ~value + \
-                    256 if checksum['type'] == CHECKSUM_TYPE_SPEC_HALF_BYTE_INVERSE else value
-                apply_byte_pos = checksum['checksum_byte_pos'] >> 1
-                if 0 == (checksum['checksum_byte_pos'] & 0x01):
-                    ir_hex[apply_byte_pos] = (
-                        (ir_hex[apply_byte_pos] & 0x0F) | (value << 4)) % 256
-                else:
-                    ir_hex[apply_byte_pos] = (
-                        (ir_hex[apply_byte_pos] & 0xF0) | (value & 0x0F)) % 256
-            elif checksum['type'] == CHECKSUM_TYPE_SPEC_HALF_BYTE_ONE_BYTE or checksum['type'] == CHECKSUM_TYPE_SPEC_HALF_BYTE_INVERSE_ONE_BYTE:
-                if not 'spec_pos' in checksum:
+        for checksum in self._checksum_plans:
+            checksum(ir_hex)
+        return ir_hex
+
+    def checksum_valid(self, ir_hex):
+        """Return whether the checksums of a byte frame are right."""
+        if self._byte_tables is None:
+            self._compile()
+        checked = bytearray(ir_hex)
+        for checksum in self._checksum_plans:
+            checksum(checked)
+        return checked == ir_hex
+
+    def _field_steps(self, power, temperature, mode, speed, swing, function_code):
+        """Return the plans of power, mode, speed, swing, temperature and function, None when not applied."""
+        on = power == POWER_ON
+        return (
+            self._power_plans[power] if len(self._power_plans) > power else None,
+            self._mode_plans[mode] if on and self._mode_plans else None,
+            self._speed_plans[speed] if on and self._speed_plans else None,
+            self._swing_plans[swing] if on and self._swing_plans else None,
+            self._temp_plans[temperature - 16] if on and self._temp_plans else None,
+            self._function_plans.get(function_code),
+        )
+
+    def ir_decode_batch(self, states):
+        """Decode many states at once.
+
+        states are (power, temperature, mode, speed, swing) tuples. Returns an
+        array('H') of one copy of every frame, the same pulses as
+        ir_decode_frame(...).once(), and an array('I') of the len(states) + 1
+        offsets delimiting the frames. Vectorized when numpy is installed.
+        """
+        if self._byte_tables is None:
+            self._compile()
+        if np is None or not states:
+            return self._decode_batch_scalar(states)
+        return self._decode_batch_numpy(states)
+
+    def _decode_batch_scalar(self, states):
+        encoder = FrameEncoder(self)
+        pulses = array('H')
+        offsets = array('I', [0])
+        for power, temperature, mode, speed, swing in states:
+            pulses.extend(encoder.encode(power, temperature, mode, speed, swing).once())
+            offsets.append(len(pulses))
+        return pulses, offsets
+
+    def _decode_batch_numpy(self, states):
+        values = np.array(states, dtype=np.intp).reshape(-1, 5)
+        count = len(values)
+        codes = np.empty((count, len(self._default_code)), dtype=np.uint8)
+        codes[:] = np.frombuffer(self._default_code, dtype=np.uint8)
+
+        # the fields in the order of _field_steps, each value on all the rows having it
+        on = values[:, 0] == POWER_ON
+        fields = (
+            (self._power_plans, values[:, 0], np.ones(count, dtype=bool), 0),
+            (self._mode_plans, values[:, 2], on, 0),
+            (self._speed_plans, values[:, 3], on, 0),
+            (self._swing_plans, values[:, 4], on, 0),
+            (self._temp_plans, values[:, 1], on, 16),
+        )
+        for plans, column, applied, base in fields:
+            if not plans:
+                continue
+            for value in np.unique(column[applied]).tolist():
+                if plans is self._power_plans and value >= len(plans):
                     continue
-                for pos in checksum['spec_pos']:
-                    byte_pos = pos >> 1
-                    value += ir_hex[byte_pos] >> 4 if 0 == (
-                        pos & 0x01) else ir_hex[byte_pos] & 0x0F
-                value += checksum['checksum_plus']
-                value %= 256
-                value = ~value + \
-                    256 if checksum['type'] == CHECKSUM_TYPE_SPEC_HALF_BYTE_INVERSE_ONE_BYTE else value
-                apply_byte_pos = checksum['checksum_byte_pos'] >> 1
-                ir_hex[apply_byte_pos] = value % 256
-
-        ir_raw = []
-        ir_raw.extend(self._boot_code)
-        for i in range(0, len(ir_hex)):
+                _apply_rows(codes, np.flatnonzero(applied & (column == value)), plans[value - base])
+        function_plan = self._function_plans.get(1)
+        if function_plan is not None:
+            _apply_rows(codes, np.arange(count), function_plan)
+        for checksum in self._checksum_plans:
+            _apply_rows(codes, np.arange(count), checksum)
+
+        if len(self._zero) != len(self._one):
+            # frames of different lengths, expand them one by one
+            pulses = array('H')
+            offsets = array('I', [0])
+            for ir_hex in codes:
+                raw = bytearray(self._head_pulses)
+                for table, value in zip(self._byte_tables, ir_hex):
+                    raw += table[value]
+                raw += self._tail_pulses
+                pulses.frombytes(raw)
+                offsets.append(len(pulses))
+            return pulses, offsets
+
+        if self._batch_layout is None:
+            self._batch_layout = self._build_batch_layout()
+        bit_cols, width, runs = self._batch_layout
+
+        # bits of every byte, most significant first, and a zero bit for widths above 8
+        bits = np.hstack([np.unpackbits(codes, axis=1), np.zeros((count, 1), dtype=np.uint8)])
+        bit_pulses = np.take(np.array([self._zero, self._one], dtype=np.uint16),
+                             bits[:, bit_cols], axis=0).reshape(count, -1)
+        raw = np.empty((count, width), dtype=np.uint16)
+        for start, stop, source in runs:
+            raw[:, start:stop] = bit_pulses[:, source] if isinstance(source, slice) else source
+
+        pulses = array('H')
+        pulses.frombytes(raw.tobytes())
+        # every frame has the same length
+        offsets = array('I', range(0, (count + 1) * width, width))
+        return pulses, offsets
+
+    def _build_batch_layout(self):
+        """Return how to expand a matrix of byte frames to pulses.
+
+        bit_cols lists the sent bits as columns of the unpacked bytes. A frame
+        of width pulses is made of runs (start, stop, source), the source being
+        a slice of the pulses of the sent bits or constant pulses: boot code,
+        delay codes and tail.
+        """
+        zero_bit = len(self._default_code) * 8
+        pulse_len = len(self._zero)
+        bit_cols = []
+        runs = []
+        width = 0
+
+        def add_constants(pulses):
+            nonlocal width
+            if len(pulses):
+                runs.append((width, width + len(pulses), np.array(pulses, dtype=np.uint16)))
+                width += len(pulses)
+
+        add_constants(memoryview(self._head_pulses).cast('H'))
+        for i, delay in enumerate(self._byte_delays):
             bit_num = self._bits_per_byte(i)
-            for j in range(0, bit_num):
-                mask = 0x00
-                if self._endian == 0:
-                    mask = ((1 << (bit_num - 1)) >> j)
-                else:
-                    mask = (1 << j)
-                if ir_hex[i] & mask:
-                    ir_raw.extend(self._one)
-                else:
-                    ir_raw.extend(self._zero)
-            for delay in self._delay:
-                if delay['pos'] == i:
-                    ir_raw.extend(delay['time'])
-        if self._last_bit == 0:
-            ir_raw.append(self._one[0])
-        for delay in self._delay:
-            if delay['pos'] == -1:
-                ir_raw.extend(delay['time'])
-        # for i in range(1, len(ir_raw), 2):
-        #     ir_raw[i] = -ir_raw[i]
-        ir_raw *= self._repeat_time
-        return ir_raw
+            first = len(bit_cols) * pulse_len
+            for bit in range(bit_num - 1, -1, -1) if self._endian == 0 else range(0, bit_num):
+                bit_cols.append(i * 8 + 7 - bit if bit < 8 else zero_bit)
+            runs.append((width, width + bit_num * pulse_len, slice(first, first + bit_num * pulse_len)))
+            width += bit_num * pulse_len
+            add_constants(delay)
+        add_constants(memoryview(self._tail_pulses).cast('H'))
+        return np.array(bit_cols, dtype=np.intp), width, runs
+
+    @property
+    def repeat_time(self):
+        return self._repeat_time
 
     def _apply_type_1(self, hex, data, is_temp=False):
         for i in range(0, len(data), 2):
@@ -462,6 +774,84 @@ class AC:
             index += seg_len
         return result
 
+    def _compile(self):
+        self._power_plans = self._segment_plans(self._power1)
+        self._mode_plans = None
+        self._speed_plans = None
+        self._swing_plans = None
+        self._temp_plans = None
+        if AC_FUNCTION_MODE not in self._solo_function:
+            self._mode_plans = self._field_plans(self._mode1, self._mode2)
+        if AC_FUNCTION_WIND_SPEED not in self._solo_function:
+            self._speed_plans = self._field_plans(self._speed1, self._speed2)
+        if AC_FUNCTION_WIND_SWING not in self._solo_function and AC_FUNCTION_WIND_FIX not in self._solo_function:
+            self._swing_plans = self._field_plans(self._swing1, self._swing2)
+        if AC_FUNCTION_TEMPERATURE_UP not in self._solo_function and AC_FUNCTION_TEMPERATURE_DOWN not in self._solo_function:
+            if self._temp1:
+                self._temp_plans = self._segment_plans(
+                    self._temp1, is_temp=self._temp1_type == 'dynamic')
+            elif self._temp2:
+                self._temp_plans = self._segment_plans(
+                    self._temp2, True, self._temp2_type == 'dynamic')
+
+        self._function_plans = {}
+        for code, data in self._function2.items():
+            self._function_plans[code] = self._segment_plan(data, True)
+        for code, data in self._function1.items():
+            self._function_plans[code] = self._segment_plan(data)
+
+        self._checksum_plans = [_checksum_plan(checksum) for checksum in self._checksum
+                                if CHECKSUM_TYPE_BYTE <= checksum['type'] <= CHECKSUM_TYPE_SPEC_HALF_BYTE_INVERSE_ONE_BYTE]
+
+        self._build_byte_tables()
+
+    def _field_plans(self, type_1, type_2):
+        if type_1:
+            return self._segment_plans(type_1)
+        if type_2:
+            return self._segment_plans(type_2, True)
+        return None
+
+    def _segment_plans(self, segments, type_2=False, is_temp=False):
+        return [self._segment_plan(data, type_2, is_temp) for data in segments]
+
+    def _segment_plan(self, data, type_2=False, is_temp=False):
+        """Return a function applying a segment to a frame in place."""
+        try:
+            if not is_temp:
+                return _masks_plan(_type_2_masks(data) if type_2 else _type_1_masks(data))
+            if not type_2:
+                return _add_plan([(data[i], data[i + 1]) for i in range(0, len(data), 2)])
+        except (IndexError, ValueError):
+            # malformed segment, keep failing on decode as before
+            pass
+        apply = self._apply_type_2 if type_2 else self._apply_type_1
+        return lambda ir_hex: apply(ir_hex, data, is_temp)
+
+    def _build_byte_tables(self):
+        self._head_pulses = array('H', self._boot_code).tobytes()
+        tail = []
+        if self._last_bit == 0:
+            tail.append(self._one[0])
+        for d in self._delay:
+            if d['pos'] == -1:
+                tail.extend(d['time'])
+        self._tail_pulses = array('H', tail).tobytes()
+
+        # byte position -> table mapping a byte value to its pulses, followed
+        # by the delay code of the position
+        byte_tables = []
+        self._byte_delays = []
+        for i in range(0, len(self._default_code)):
+            delay = []
+            for d in self._delay:
+                if d['pos'] == i:
+                    delay.extend(d['time'])
+            self._byte_delays.append(tuple(delay))
+            byte_tables.append(_pulse_table(
+                self._bits_per_byte(i), self._endian, tuple(self._zero), tuple(self._one), tuple(delay)))
+        self._byte_tables = byte_tables
+
     def _bits_per_byte(self, index):
         if not self._bit_num:
             return 8
@@ -513,3 +903,168 @@ class AC:
         if self._swing_mode not in ["0", "1"] and ( self._swing1 or self._swing2):
             return swing_modes
         return []
+
+    def get_frame_length(self):
+        return len(self._default_code)
+
+    def get_checksum_types(self):
+        return sorted({checksum['type'] for checksum in self._checksum})
+
+
+class FrameEncoder:
+    """Encode the frames of a model incrementally from the previous one.
+
+    The byte frame after each field is kept, so a change only reapplies the
+    changed field, the fields after it and the checksums, and only the
+    bytes that changed are expanded to pulses again. The frames are the
+    same as AC.ir_decode_frame.
+    """
+
+    def __init__(self, ac):
+        self._ac = ac
+        self._steps = None
+        # byte frame after each field of _steps
+        self._stages = []
+        self._ir_hex = None
+        self._raw = None
+        # offset of the pulses of every byte in _raw
+        self._offsets = None
+
+    def encode(self, power, temperature, mode, speed, swing=SWING_ON, dir=0, function_code=1):
+        ac = self._ac
+        if ac._byte_tables is None:
+            ac._compile()
+        steps = ac._field_steps(power, temperature, mode, speed, swing, function_code)
+
+        first = 0
+        if self._steps is not None:
+            while first < len(steps) and steps[first] is self._steps[first]:
+                first += 1
+        if first == len(steps):
+            return Frame(self._raw, ac._repeat_time)
+
+        ir_hex = bytearray(self._stages[first - 1] if first else ac._default_code)
+        stages = self._stages[:first]
+        for plan in steps[first:]:
+            if plan is not None:
+                plan(ir_hex)
+            stages.append(bytes(ir_hex))
+        for checksum in ac._checksum_plans:
+            checksum(ir_hex)
+
+        if self._ir_hex is None:
+            self._expand(ir_hex)
+        else:
+            raw = self._raw
+            tables = ac._byte_tables
+            for i, (old, new) in enumerate(zip(self._ir_hex, ir_hex)):
+                if old == new:
+                    continue
+                start = self._offsets[i]
+                pulses = tables[i][new]
+                if len(pulses) != len(tables[i][old]):
+                    self._expand(ir_hex)
+                    break
+                raw[start:start + len(pulses)] = pulses
+
+        # set last, a failing plan leaves the previous frame intact
+        self._steps = steps
+        self._stages = stages
+        self._ir_hex = ir_hex
+        return Frame(self._raw, ac._repeat_time)
+
+    def _expand(self, ir_hex):
+        ac = self._ac
+        raw = bytearray(ac._head_pulses)
+        offsets = []
+        for pulses, value in zip(ac._byte_tables, ir_hex):
+            offsets.append(len(raw))
+            raw += pulses[value]
+        raw += ac._tail_pulses
+        self._raw = raw
+        self._offsets = offsets
+
+
+class PulseDecoder:
+    """Turn received pulses back into the byte frame of a model.
+
+    A pulse matches a duration of the model when it is within tolerance,
+    a ratio of the duration. Signed pulses, spaces being negative, are
+    accepted. Only the first copy of a repeated frame is read, and only
+    the bits a model sends are known: the others read as 0, see sent_bits.
+    """
+
+    def __init__(self, ac, tolerance=0.25):
+        if ac._byte_tables is None:
+            ac._compile()
+        self._tolerance = tolerance
+        self._head = tuple(memoryview(ac._head_pulses).cast('H'))
+        self._zero = tuple(ac._zero)
+        self._one = tuple(ac._one)
+        self._endian = ac._endian
+        # (bits, delay code) of every byte position
+        self._positions = [(ac._bits_per_byte(i), delay) for i, delay in enumerate(ac._byte_delays)]
+        # whether every bit of the byte frames is sent
+        self.complete = all(bit_num >= 8 for bit_num, delay in self._positions)
+
+    def sent_bits(self, ir_hex):
+        """Return a byte frame with the bits the model doesn't send cleared."""
+        return bytes(value & ((1 << min(bit_num, 8)) - 1)
+                     for value, (bit_num, delay) in zip(ir_hex, self._positions))
+
+    def decode(self, pulses):
+        """Return the byte frames some pulses can be, none when they don't match the model.
+
+        There are two when the capture lacks the final space and the last
+        bit can't be told from it.
+        """
+        pulses = [abs(pulse) for pulse in pulses]
+        pos = self._match(pulses, 0, self._head)
+        if pos is None:
+            return []
+        frames = [b'']
+        for bit_num, delay in self._positions:
+            values = [0]
+            for bit in range(0, bit_num):
+                one = self._match(pulses, pos, self._one)
+                zero = self._match(pulses, pos, self._zero)
+                if one is None and zero is None:
+                    return []
+                if one is not None and zero is not None:
+                    if one > len(pulses):
+                        sent = (1, 0)
+                    else:
+                        # the closer one
+                        sent = (1,) if (self._error(pulses, pos, self._one)
+                                        <= self._error(pulses, pos, self._zero)) else (0,)
+                else:
+                    sent = (1,) if one is not None else (0,)
+                pos = one if sent[0] else zero
+                if self._endian == 0:
+                    values = [(value << 1) | b for value in values for b in sent]
+                else:
+                    values = [value | (b << bit) for value in values for b in sent]
+            pos = self._match(pulses, pos, delay)
+            values = [value for value in values if value <= 0xFF]
+            if pos is None or not values:
+                return []
+            frames = [frame + bytes((value,)) for frame in frames for value in values]
+        return frames
+
+    def _match(self, pulses, pos, expected):
+        """Return the position after expected durations at pos, None when they don't match.
+
+        Receivers end a capture on the last mark, so a missing final space
+        matches.
+        """
+        end = pos + len(expected)
+        if end > len(pulses) and not (end == len(pulses) + 1 and end % 2 == 0):
+            return None
+        for pulse, duration in zip(pulses[pos:end], expected):
+            if abs(pulse - duration) > duration * self._tolerance:
+                return None
+        return end
+
+    @staticmethod
+    def _error(pulses, pos, expected):
+        return sum(abs(pulse - duration) for pulse, duration in zip(pulses[pos:pos + len(expected)], expected))
@@ -0,0 +1,205 @@
+"""Access to the irext code library.
+
+Everything here reads files and parses bins, so it must run in the executor;
+use async_load to do so from the event loop.
+"""
+import bisect
+import json
+import os.path
+import threading
+import time
+
+from homeassistant.core import HomeAssistant
+
+from . import CACHE_AB_DIR, CODES_AB_DIR, _LOGGER
+from .cache import cache_path, compile_cache, load_device_data
+from .const import DOMAIN
+from .irext import AC
+from .pack import PACK_FILE, CodePack, PackError
+from .util import StateIndex
+
+INDEX_FILE = 'index.json'
+
+DATA_CATALOG = 'catalog'
+
+# the open pack file, reopened when it changes
+_pack_lock = threading.Lock()
+_pack = None
+_pack_error_mtime = None
+
+
+def _current_pack():
+    """Return the pack of the code library, None when there is no usable one.
+
+    Must be called with _pack_lock held.
+    """
+    global _pack, _pack_error_mtime
+    path = os.path.join(CODES_AB_DIR, PACK_FILE)
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        mtime = None
+    if _pack is not None and _pack.mtime == mtime:
+        return _pack
+
+    if _pack is not None:
+        _pack.close()
+        _pack = None
+    if mtime is None or mtime == _pack_error_mtime:
+        return None
+    try:
+        _pack = CodePack(path)
+    except (OSError, PackError, ValueError, KeyError, TypeError) as e:
+        _LOGGER.warning("Ignoring the code pack %s, using the loose files: %s", path, e)
+        _pack_error_mtime = mtime
+        return None
+    _LOGGER.debug("Opened the code pack %s with %d bins", path, len(_pack))
+    return _pack
+
+
+def read_device_bin(device_file):
+    """Return the content of a device bin, from the pack when it has it."""
+    with _pack_lock:
+        pack = _current_pack()
+        if pack is not None and device_file in pack:
+            return pack.read(device_file)
+    with open(os.path.join(CODES_AB_DIR, device_file), 'rb') as f:
+        return f.read()
+
+
+def load_device(device_file, bin_data):
+    """Return the capabilities and commands of a device bin, given its content."""
+    os.makedirs(CODES_AB_DIR, exist_ok=True)
+    return load_device_data(bin_data, cache_path(CACHE_AB_DIR, device_file))
+
+
+def compile_device(device_file, bin_data):
+    """Write the compiled cache of a device bin, given its content, and return its commands."""
+    return compile_cache(bin_data, cache_path(CACHE_AB_DIR, device_file))
+
+
+def load_ac(device_file):
+    """Return the parsed model of a device bin."""
+    return AC(read_device_bin(device_file))
+
+
+def load_state_index(bin_data):
+    """Return the index mapping received frames of a device bin to states, given its content."""
+    return StateIndex(AC(bin_data))
+
+
+def get_catalog(hass: HomeAssistant):
+    """Return the catalog of the code library."""
+    data = hass.data.setdefault(DOMAIN, {})
+    if DATA_CATALOG not in data:
+        data[DATA_CATALOG] = CodeCatalog(os.path.join(CODES_AB_DIR, INDEX_FILE))
+    return data[DATA_CATALOG]
+
+
+class CodeCatalog:
+    """Brands and models of the index, reloaded when it changes.
+
+    The index of the pack file is used when there is one, else the index file.
+    """
+
+    def __init__(self, path):
+        self._path = path
+        self._source = None
+        # brand names in index order
+        self.brands = []
+        # brand -> {bin: device name}
+        self.devices = {}
+        # bin -> (brand, device name) of its first listing
+        self.models = {}
+        # bin -> capabilities or error of the model, when the index has them
+        self.info = {}
+        # sorted (casefolded brand, brand) for prefix search
+        self._sorted = []
+
+    def refresh(self):
+        """Load the index if it changed since the last call."""
+        with _pack_lock:
+            pack = _current_pack()
+            if pack is not None:
+                source = (PACK_FILE, pack.mtime)
+                ac_index = pack.index
+        if pack is None:
+            source = (self._path, os.stat(self._path).st_mtime_ns)
+        if source == self._source:
+            return self
+
+        if pack is None:
+            with open(self._path) as f:
+                ac_index = json.load(f)
+
+        brands = []
+        devices = {}
+        models = {}
+        info = {}
+        for brand in ac_index:
+            brand_name = brand["brand_name"]
+            brands.append(brand_name)
+            devices[brand_name] = {}
+            for device in brand["devices"]:
+                devices[brand_name][device["bin"]] = device["device_name"]
+                models.setdefault(device["bin"], (brand_name, device["device_name"]))
+                if "capabilities" in device or "error" in device:
+                    info[device["bin"]] = {key: device[key] for key in ("capabilities", "error") if key in device}
+
+        self.brands = brands
+        self.devices = devices
+        self.models = models
+        self.info = info
+        self._sorted = sorted((brand.casefold(), brand) for brand in brands)
+        self._source = source
+        _LOGGER.debug("Loaded %d brands and %d models", len(brands), len(models))
+        return self
+
+    def usable_devices(self, brand):
+        """Return the models of a brand, leaving out the ones the index marks invalid."""
+        devices = self.devices[brand]
+        usable = {device_file: name for device_file, name in devices.items()
+                  if "error" not in self.info.get(device_file, {})}
+        return usable or dict(devices)
+
+    def label(self, device_file, name):
+        """Return a device name followed by the modes, temperatures and swing of the model."""
+        capabilities = self.info.get(device_file, {}).get("capabilities")
+        if not capabilities:
+            return name
+        return "%s (%s, %d-%d°C%s)" % (
+            name, "/".join(capabilities["operationModes"]),
+            capabilities["minTemperature"], capabilities["maxTemperature"],
+            ", swing" if capabilities["swingModes"] else "")
+
+    def search(self, text):
+        """Return the brands starting with text, then the ones containing it."""
+        text = text.strip().casefold()
+        if not text:
+            return list(self.brands)
+
+        start = bisect.bisect_left(self._sorted, (text,))
+        result = []
+        for folded, brand in self._sorted[start:]:
+            if not folded.startswith(text):
+                break
+            result.append(brand)
+        found = set(result)
+        result.extend(brand for folded, brand in self._sorted
+                      if text in folded and brand not in found)
+        return result
+
+
+async def async_load(hass: HomeAssistant, func, *args):
+    """Run a library function in the executor and log how long it took."""
+    start = time.monotonic()
+    result, elapsed = await hass.async_add_executor_job(_timed, func, *args)
+    _LOGGER.debug("%s%s took %.3fs in the executor, %.3fs until resumed on the event loop",
+                  func.__name__, args, elapsed, time.monotonic() - start)
+    return result
+
+
+def _timed(func, *args):
+    start = time.monotonic()
+    result = func(*args)
+    return result, time.monotonic() - start
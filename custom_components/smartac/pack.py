@@ -0,0 +1,96 @@
+"""Code library packed in one file.
+
+A pack holds the index file and every bin it lists, so that installing or
+backing up a library copies one file instead of thousands. It is memory
+mapped, reading a model only touches the pages of its bin.
+
+Layout (little-endian):
+    header  magic, format version, meta length
+    meta    json with the index and the (offset, length) of every bin
+    bins    the bins, concatenated, offsets counted from the first one
+"""
+import json
+import mmap
+import os
+import struct
+
+PACK_MAGIC = b'SACP'
+PACK_VERSION = 1
+PACK_FILE = 'library.pack'
+
+_HEADER = struct.Struct('<4sHI')
+
+
+class PackError(Exception):
+    """The pack file is corrupt or of another format."""
+
+
+def write_pack(path, index, codes_dir):
+    """Pack an index and the bins it lists, read from codes_dir."""
+    bins = {}
+    offset = 0
+    for brand in index:
+        for device in brand['devices']:
+            name = device['bin']
+            if name in bins:
+                continue
+            bins[name] = (offset, os.path.getsize(os.path.join(codes_dir, name)))
+            offset += bins[name][1]
+    meta = json.dumps({'index': index, 'bins': bins}).encode('utf-8')
+
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(_HEADER.pack(PACK_MAGIC, PACK_VERSION, len(meta)))
+        f.write(meta)
+        for name, (offset, length) in bins.items():
+            with open(os.path.join(codes_dir, name), 'rb') as bin_file:
+                data = bin_file.read()
+            if len(data) != length:
+                raise PackError('%s changed while packing' % name)
+            f.write(data)
+    os.replace(tmp_path, path)
+    return len(bins)
+
+
+class CodePack:
+    """The index and bins of a pack file."""
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self.mtime = os.fstat(f.fileno()).st_mtime_ns
+            try:
+                self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError as e:
+                raise PackError('empty pack file') from e
+
+        try:
+            if len(self._map) < _HEADER.size:
+                raise PackError('truncated header')
+            magic, version, meta_len = _HEADER.unpack_from(self._map)
+            if magic != PACK_MAGIC or version != PACK_VERSION:
+                raise PackError('unsupported pack format')
+            self._bins_start = _HEADER.size + meta_len
+            meta = json.loads(self._map[_HEADER.size:self._bins_start].decode('utf-8'))
+            self.index = meta['index']
+            self._bins = {name: tuple(entry) for name, entry in meta['bins'].items()}
+            for offset, length in self._bins.values():
+                if self._bins_start + offset + length > len(self._map):
+                    raise PackError('bin out of range')
+        except (PackError, ValueError, KeyError, TypeError):
+            self._map.close()
+            raise
+
+    def __len__(self):
+        return len(self._bins)
+
+    def __contains__(self, device_file):
+        return device_file in self._bins
+
+    def read(self, device_file):
+        """Return the content of a bin."""
+        offset, length = self._bins[device_file]
+        start = self._bins_start + offset
+        return self._map[start:start + length]
+
+    def close(self):
+        self._map.close()
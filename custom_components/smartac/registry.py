@@ -0,0 +1,125 @@
+"""Models shared by all the config entries using the same device bin."""
+from homeassistant.core import HomeAssistant
+
+from . import _LOGGER
+from .const import DOMAIN
+from .cache import bin_hash
+from .library import async_load, compile_device, load_device, load_state_index, read_device_bin
+from .util import CommandTable, LazyCommands
+
+DATA_MODELS = 'models'
+
+
+def get_registry(hass: HomeAssistant):
+    """Return the model registry of this integration."""
+    data = hass.data.setdefault(DOMAIN, {})
+    if DATA_MODELS not in data:
+        data[DATA_MODELS] = ModelRegistry(hass)
+    return data[DATA_MODELS]
+
+
+class ModelRegistry:
+    """Reference count the loaded models by the content of their device bin.
+
+    Entries using byte-identical bins share one model, even when the bins
+    have different file names. The StateIndex of a model is built when an
+    entry first needs it and freed with the model.
+    """
+
+    def __init__(self, hass: HomeAssistant):
+        self._hass = hass
+        # bin hash -> task loading the model, content of the bin
+        self._models = {}
+        self._bins = {}
+        # bin hash -> ids of the entries using the model
+        self._entries = {}
+        # entry id -> device file and bin hash
+        self._devices = {}
+        # bin hash -> task building the state index
+        self._indexes = {}
+
+    async def async_acquire(self, entry_id, device_file):
+        """Return the capabilities and commands of a device bin, loading each distinct bin once."""
+        bin_data = await async_load(self._hass, read_device_bin, device_file)
+        key = bin_hash(bin_data)
+        task = self._models.get(key)
+        if task is None:
+            task = self._hass.async_create_task(self._async_load(device_file, bin_data))
+            self._models[key] = task
+        else:
+            _LOGGER.debug("%s shares a loaded model", device_file)
+
+        try:
+            device_data = await task
+        except Exception:
+            # let the next entry retry
+            if self._models.get(key) is task:
+                del self._models[key]
+            raise
+
+        # the model may have been released by another entry meanwhile
+        self._models.setdefault(key, task)
+        self._bins.setdefault(key, bin_data)
+        self._devices[entry_id] = (device_file, key)
+        self._entries.setdefault(key, set()).add(entry_id)
+        _LOGGER.debug("The model of %s is used by %d entries", device_file, len(self._entries[key]))
+        return device_data
+
+    async def _async_load(self, device_file, bin_data):
+        device_data = await async_load(self._hass, load_device, device_file, bin_data)
+        commands = device_data['commands']
+        if isinstance(commands, CommandTable):
+            _LOGGER.debug("%s has %d frames, %d unique (dedup ratio %.2f)", device_file,
+                          commands.frame_count, commands.unique_count, commands.dedup_ratio)
+        elif isinstance(commands, LazyCommands):
+            self._hass.async_create_task(self._async_compile(device_file, bin_data, commands))
+        return device_data
+
+    async def _async_compile(self, device_file, bin_data, commands):
+        """Build the compiled cache of a model decoded on demand, then serve its frames from it."""
+        try:
+            compiled = await async_load(self._hass, compile_device, device_file, bin_data)
+        except Exception as e:
+            # keep decoding on demand
+            _LOGGER.warning("Couldn't compile %s: %s", device_file, e)
+            return
+        commands.compiled = compiled
+        _LOGGER.debug("%s is served from its compiled cache", device_file)
+
+    async def async_state_index(self, entry_id):
+        """Return the StateIndex of the model an entry acquired, building it once."""
+        device_file, key = self._devices[entry_id]
+        task = self._indexes.get(key)
+        if task is None:
+            task = self._hass.async_create_task(async_load(self._hass, load_state_index, self._bins[key]))
+            self._indexes[key] = task
+
+        try:
+            state_index = await task
+        except Exception:
+            if self._indexes.get(key) is task:
+                del self._indexes[key]
+            raise
+
+        # don't keep the index of a model released meanwhile
+        if key not in self._entries:
+            self._indexes.pop(key, None)
+        return state_index
+
+    def release(self, entry_id):
+        """Drop the reference of an entry, freeing the model when it was the last one."""
+        device = self._devices.pop(entry_id, None)
+        if device is None:
+            return
+        device_file, key = device
+        entries = self._entries[key]
+        entries.discard(entry_id)
+        if not entries:
+            del self._entries[key]
+            self._models.pop(key, None)
+            self._bins.pop(key, None)
+            self._indexes.pop(key, None)
+            _LOGGER.debug("Released the model of %s", device_file)
+
+    def __len__(self):
+        return len(self._entries)
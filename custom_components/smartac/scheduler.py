@@ -0,0 +1,46 @@
+"""Serialize the transmissions of the entities sharing an IR transmitter."""
+import asyncio
+import time
+
+from homeassistant.core import HomeAssistant
+
+from .const import DOMAIN
+
+DATA_SCHEDULERS = 'schedulers'
+
+
+def get_scheduler(hass: HomeAssistant, controller):
+    """Return the scheduler of the transmitter a controller sends to."""
+    schedulers = hass.data.setdefault(DOMAIN, {}).setdefault(DATA_SCHEDULERS, {})
+    if controller.transmitter not in schedulers:
+        schedulers[controller.transmitter] = TransmitterScheduler()
+    return schedulers[controller.transmitter]
+
+
+class TransmitterScheduler:
+    """Send one frame at a time to a transmitter, keeping a gap between frames."""
+
+    def __init__(self):
+        self._lock = asyncio.Lock()
+        self._last_end = 0.0
+        # transmissions waiting or in progress
+        self.queue_depth = 0
+        # seconds the last transmission waited before it started
+        self.last_wait = 0.0
+
+    async def async_transmit(self, send, command, gap=0):
+        """Send a command once the transmitter is free and gap seconds passed since the last frame."""
+        start = time.monotonic()
+        self.queue_depth += 1
+        try:
+            async with self._lock:
+                delay = self._last_end + gap - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                self.last_wait = time.monotonic() - start
+                try:
+                    await send(command)
+                finally:
+                    self._last_end = time.monotonic()
+        finally:
+            self.queue_depth -= 1
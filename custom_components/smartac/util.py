@@ -1,22 +1,27 @@
-from collections import defaultdict
-from homeassistant.components.climate.const import (
-    FAN_AUTO,
-    FAN_HIGH,
-    FAN_LOW,
-    FAN_MEDIUM,
-    HVAC_MODE_AUTO,
-    HVAC_MODE_COOL,
-    HVAC_MODE_DRY,
-    HVAC_MODE_FAN_ONLY,
-    HVAC_MODE_HEAT,
-    SWING_OFF as HA_SWING_OFF,
-    SWING_ON as HA_SWING_ON,
-)
+from abc import ABC, abstractmethod
+from array import array
+from collections import OrderedDict
+import hashlib
 from .irext import MODE_AUTO, MODE_COOL, MODE_DRY, MODE_FAN, MODE_HEAT
 from .irext import SPEED_AUTO, SPEED_HIGH, SPEED_LOW, SPEED_MEDIUM
 from .irext import POWER_OFF, POWER_ON
 from .irext import SWING_OFF, SWING_ON
-from .irext import AC
+from .irext import AC, Frame, FrameEncoder, PulseDecoder
+
+# values of the home assistant climate constants, spelled out so that the
+# code library tools can import this module without home assistant
+HVAC_MODE_AUTO = 'auto'
+HVAC_MODE_COOL = 'cool'
+HVAC_MODE_DRY = 'dry'
+HVAC_MODE_FAN_ONLY = 'fan_only'
+HVAC_MODE_HEAT = 'heat'
+HVAC_MODE_OFF = 'off'
+FAN_AUTO = 'auto'
+FAN_HIGH = 'high'
+FAN_LOW = 'low'
+FAN_MEDIUM = 'medium'
+HA_SWING_OFF = 'off'
+HA_SWING_ON = 'on'
 
 mode_map = {MODE_AUTO: HVAC_MODE_AUTO, MODE_COOL: HVAC_MODE_COOL,
             MODE_DRY: HVAC_MODE_DRY, MODE_FAN: HVAC_MODE_FAN_ONLY, MODE_HEAT: HVAC_MODE_HEAT}
@@ -24,45 +29,283 @@ speed_map = {SPEED_AUTO: FAN_AUTO, SPEED_HIGH: FAN_HIGH,
              SPEED_LOW: FAN_LOW, SPEED_MEDIUM: FAN_MEDIUM}
 swing_map = {SWING_ON: HA_SWING_ON, SWING_OFF: HA_SWING_OFF}
 
+mode_code = {v: k for k, v in mode_map.items()}
+speed_code = {v: k for k, v in speed_map.items()}
+swing_code = {v: k for k, v in swing_map.items()}
 
-def bin_to_json(bin_data):
-    """Validate that this is a valid topic name/filter."""
-    decode_json = {}
-    decode_json['manufacturer'] = 'hass'
+DEFAULT_TEMPERATURE = 26
+DEFAULT_FRAME_CACHE_SIZE = 16
+
+OFF_STATE = (POWER_OFF, MODE_AUTO, SPEED_AUTO, SWING_ON, DEFAULT_TEMPERATURE)
+
+# states are numbered power, mode, speed, swing, temperature 16-30
+STATE_COUNT = 2 * 5 * 4 * 2 * 15
+
+
+def state_code(key):
+    """Return the integer code of a (power, mode, speed, swing, temperature) key."""
+    power, mode, speed, swing, temperature = key
+    if not (0 <= power < 2 and 0 <= mode < 5 and 0 <= speed < 4 and 0 <= swing < 2
+            and 16 <= temperature <= 30):
+        raise KeyError(key)
+    return (((power * 5 + mode) * 4 + speed) * 2 + swing) * 15 + temperature - 16
+
+
+def state_key(code):
+    """Return the (power, mode, speed, swing, temperature) key of a state code."""
+    code, temperature = divmod(code, 15)
+    code, swing = divmod(code, 2)
+    code, speed = divmod(code, 4)
+    power, mode = divmod(code, 5)
+    return (power, mode, speed, swing, temperature + 16)
+
+
+def frame_digest(pulses):
+    """Return the content hash frames are deduplicated by."""
+    return hashlib.blake2b(pulses.tobytes(), digest_size=16).digest()
+
+
+def get_capabilities(ac):
+    """Return the supported modes and ranges of a model without decoding any frame."""
+    capabilities = {}
+    capabilities['manufacturer'] = 'hass'
 
-    ac = AC(bin_data)
     modes = ac.get_supported_mode()
     swing_modes = ac.get_supported_swing_mode()
-    decode_json['operationModes'] = [mode_map[m] for m in modes]
+    capabilities['operationModes'] = [mode_map[m] for m in modes]
 
     speeds = set()
     temperature = set()
-
-    decode_json["commands"] = defaultdict(
-        lambda: defaultdict(lambda: defaultdict(dict)))
     for m in modes:
-        for s in (ac.get_supported_wind_speed(m) or [SPEED_AUTO]):
-            speeds.add(s)
-            for t in (ac.get_temperature_range(m) or [26]):
-                temperature.add(t)
-                mode_key = mode_map[m]
-                speed_key = speed_map[s]
-                temperature_key = "%d" % t
-                if swing_modes:
-                    for swing in swing_modes:
-                        swing_key = swing_map[swing]
-                        raw = ac.ir_decode(POWER_ON, t, m, s, swing=swing)
-                        decode_json["commands"][mode_key][speed_key][swing_key][temperature_key] = raw
-                else:
-                    raw = ac.ir_decode(POWER_ON, t, m, s)
-                    decode_json["commands"][mode_key][speed_key][temperature_key] = raw
-    raw = ac.ir_decode(POWER_OFF, 26, MODE_AUTO, SPEED_AUTO)
-
-    decode_json["commands"]["off"] = raw
-
-    decode_json['fanModes'] = [speed_map[s] for s in speeds]
-    decode_json['swingModes'] = [swing_map[swing] for swing in swing_modes]
-    decode_json['minTemperature'] = min(temperature)
-    decode_json['maxTemperature'] = max(temperature)
+        speeds.update(ac.get_supported_wind_speed(m) or [SPEED_AUTO])
+        temperature.update(ac.get_temperature_range(m) or [DEFAULT_TEMPERATURE])
+
+    capabilities['fanModes'] = [speed_map[s] for s in speeds]
+    capabilities['swingModes'] = [swing_map[swing] for swing in swing_modes]
+    capabilities['minTemperature'] = min(temperature)
+    capabilities['maxTemperature'] = max(temperature)
+
+    return capabilities
+
+
+def get_index_capabilities(ac):
+    """Return the capabilities of a model as listed in the index file.
+
+    These add the length of a frame in bytes and the checksum types to
+    get_capabilities, still without decoding any frame.
+    """
+    capabilities = get_capabilities(ac)
+    capabilities['frameLength'] = ac.get_frame_length()
+    capabilities['checksumTypes'] = ac.get_checksum_types()
+    return capabilities
+
+
+def get_ranges(ac):
+    """Return the swing modes and the speeds and temperatures of every mode."""
+    speeds = {}
+    temperatures = {}
+    for m in ac.get_supported_mode():
+        speeds[m] = ac.get_supported_wind_speed(m)
+        temperatures[m] = ac.get_temperature_range(m)
+    return ac.get_supported_swing_mode(), speeds, temperatures
+
+
+def iter_states(ac):
+    """Yield the (power, mode, speed, swing, temperature) key of every frame of a model."""
+    swing_modes, speeds, temperatures = get_ranges(ac)
+    for m in speeds:
+        for s in (speeds[m] or [SPEED_AUTO]):
+            for t in (temperatures[m] or [DEFAULT_TEMPERATURE]):
+                for swing in (swing_modes or [SWING_ON]):
+                    yield (POWER_ON, m, s, swing, t)
+    yield OFF_STATE
+
+
+class Commands(ABC):
+    """Map home assistant states to the frames of a model."""
+
+    def __init__(self, swing_modes, speeds, temperatures):
+        self._swing_modes = swing_modes
+        self._speeds = speeds
+        self._temperatures = temperatures
+
+    def get(self, hvac_mode, fan_mode, swing_mode, temperature):
+        """Return the frame of a state given by its home assistant names."""
+        return self.frame(self.state(hvac_mode, fan_mode, swing_mode, temperature))
+
+    def state(self, hvac_mode, fan_mode, swing_mode, temperature):
+        """Return the (power, mode, speed, swing, temperature) key identifying a frame."""
+        mode = mode_code[hvac_mode]
+        speeds = self._speeds[mode]
+        temperatures = self._temperatures[mode]
+
+        # modes without speed or temperature control use a fixed frame
+        speed = speed_code[fan_mode] if speeds else SPEED_AUTO
+        temperature = round(temperature) if temperatures else DEFAULT_TEMPERATURE
+        swing = swing_code[swing_mode] if self._swing_modes else SWING_ON
+
+        if (speeds and speed not in speeds) or (temperatures and temperature not in temperatures):
+            raise KeyError((hvac_mode, fan_mode, swing_mode, temperature))
 
+        return (POWER_ON, mode, speed, swing, temperature)
+
+    def names(self, key):
+        """Return the home assistant names of a state key, the inverse of state.
+
+        Speed, swing and temperature are None when the mode doesn't control
+        them, all three when the power is off.
+        """
+        power, mode, speed, swing, temperature = key
+        if power != POWER_ON:
+            return (HVAC_MODE_OFF, None, None, None)
+        return (mode_map[mode],
+                speed_map[speed] if self._speeds[mode] else None,
+                swing_map[swing] if self._swing_modes else None,
+                temperature if self._temperatures[mode] else None)
+
+    def off(self):
+        """Return the power off frame."""
+        return self.frame(OFF_STATE)
+
+    def frame(self, key):
+        """Return the frame of a state key."""
+        return self._frame(key)
+
+    @abstractmethod
+    def _frame(self, key):
+        """Return the frame of a state key, raising KeyError when there is none."""
+
+
+class LazyCommands(Commands):
+    """Decode the frames of a model on demand, keeping the recently sent ones.
+
+    Once compiled is set to the Commands of the whole model, frames are
+    served from it instead.
+    """
+
+    compiled = None
+
+    def __init__(self, ac, cache_size=DEFAULT_FRAME_CACHE_SIZE):
+        super().__init__(*get_ranges(ac))
+        self._encoder = FrameEncoder(ac)
+        self._cache_size = cache_size
+        self._frames = OrderedDict()
+
+    def _frame(self, key):
+        if self.compiled is not None:
+            return self.compiled.frame(key)
+        frame = self._frames.get(key)
+        if frame is not None:
+            self._frames.move_to_end(key)
+            return frame
+        power, mode, speed, swing, temperature = key
+        frame = self._encoder.encode(power, temperature, mode, speed, swing=swing)
+        self._frames[key] = frame
+        if len(self._frames) > self._cache_size:
+            self._frames.popitem(last=False)
+        return frame
+
+
+class CommandTable(Commands):
+    """Every frame of a model in one pulse array, indexed by state code.
+
+    Identical frames are stored once. The table only holds arrays, lists and
+    dicts, so it can be pickled.
+    """
+
+    def __init__(self, swing_modes, speeds, temperatures, repeat=1):
+        super().__init__(swing_modes, speeds, temperatures)
+        self.repeat = repeat
+        # start and length in _pulses of the frame of every state code, 0 long when missing
+        self._starts = array('I', [0]) * STATE_COUNT
+        self._lengths = array('I', [0]) * STATE_COUNT
+        self._pulses = array('H')
+        # frame digest -> start in _pulses
+        self._index = {}
+        self.frame_count = 0
+        self.unique_count = 0
+
+    @property
+    def dedup_ratio(self):
+        """Return the number of frames per stored frame."""
+        return self.frame_count / self.unique_count if self.unique_count else 1.0
+
+    @property
+    def pulses(self):
+        return self._pulses
+
+    @classmethod
+    def from_ac(cls, ac):
+        """Decode every frame of a model."""
+        table = cls(*get_ranges(ac), ac.repeat_time)
+        keys = list(iter_states(ac))
+        pulses, offsets = ac.ir_decode_batch(
+            [(power, temperature, mode, speed, swing) for power, mode, speed, swing, temperature in keys])
+        for i, key in enumerate(keys):
+            table.add(key, pulses[offsets[i]:offsets[i + 1]])
+        return table
+
+    def add(self, key, pulses):
+        """Add the pulses of one copy of a frame."""
+        code = state_code(key)
+        digest = frame_digest(pulses)
+        start = self._index.get(digest)
+        if start is None:
+            start = self._index[digest] = len(self._pulses)
+            self._pulses.extend(pulses)
+            self.unique_count += 1
+        self._starts[code] = start
+        self._lengths[code] = len(pulses)
+        self.frame_count += 1
+
+    def entries(self):
+        """Yield the key, start and length of every frame."""
+        for code, length in enumerate(self._lengths):
+            if length:
+                yield state_key(code), self._starts[code], length
+
+    def _frame(self, key):
+        code = state_code(key)
+        length = self._lengths[code]
+        if not length:
+            raise KeyError(key)
+        start = self._starts[code]
+        return Frame(self._pulses[start:start + length], self.repeat)
+
+
+class StateIndex:
+    """Map received frames of a model back to state keys.
+
+    The byte frame of every state is indexed, so received pulses are
+    turned into bytes and their states looked up in one step instead of
+    being compared with every frame. Only frames with right checksums are
+    indexed; when the model sends every bit, received frames with wrong
+    checksums are dropped before the lookup.
+    """
+
+    def __init__(self, ac, tolerance=0.25):
+        self._ac = ac
+        self._decoder = PulseDecoder(ac, tolerance)
+        # sent bits of a byte frame -> keys of the states sending it, in iter_states order
+        self._states = {}
+        for key in iter_states(ac):
+            power, mode, speed, swing, temperature = key
+            ir_hex = ac.ir_decode_bytes(power, temperature, mode, speed, swing)
+            self._states.setdefault(self._decoder.sent_bits(ir_hex), []).append(key)
+
+    def lookup(self, pulses):
+        """Return the keys of the states sending some pulses, empty when they aren't a frame of the model."""
+        keys = []
+        for ir_hex in self._decoder.decode(pulses):
+            if self._decoder.complete and not self._ac.checksum_valid(bytearray(ir_hex)):
+                continue
+            keys.extend(self._states.get(ir_hex, ()))
+        return keys
+
+
+def bin_to_json(bin_data):
+    """Return the capabilities and the command table of a model."""
+    ac = AC(bin_data)
+    decode_json = get_capabilities(ac)
+    decode_json['commands'] = CommandTable.from_ac(ac)
     return decode_json
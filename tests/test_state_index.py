@@ -0,0 +1,40 @@
+"""Received frames mapped back to states, from recorded captures.
+
+fixtures/state_index.json lists captures of the fixture bins, each with the
+(power, mode, speed, swing, temperature) key it was sent for, or null when
+no state of the bin sends it. The captures have up to 12% jitter and cover
+signed pulses, a missing final space and repeated frames.
+"""
+import json
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIXTURES_DIR = os.path.join(ROOT, 'tests', 'fixtures')
+sys.path.insert(0, os.path.join(ROOT, 'tools'))
+
+import integration  # noqa: E402,F401
+from smartac.irext import AC  # noqa: E402
+from smartac.util import StateIndex  # noqa: E402
+
+with open(os.path.join(FIXTURES_DIR, 'state_index.json')) as f:
+    CAPTURES = json.load(f)
+
+_indexes = {}
+
+
+def state_index(device_file):
+    if device_file not in _indexes:
+        with open(os.path.join(FIXTURES_DIR, device_file), 'rb') as f:
+            _indexes[device_file] = StateIndex(AC(f.read()))
+    return _indexes[device_file]
+
+
+@pytest.mark.parametrize('device_file, capture', [
+    pytest.param(device_file, capture, id='%s: %s' % (device_file, capture['name']))
+    for device_file, captures in CAPTURES.items() for capture in captures])
+def test_lookup(device_file, capture):
+    expected = [tuple(capture['key'])] if capture['key'] else []
+    assert state_index(device_file).lookup(capture['pulses']) == expected
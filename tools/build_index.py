@@ -0,0 +1,143 @@
+"""Add the capabilities of every model to the index file of a code library.
+
+Reads the brands and models of index.json, decodes every frame of their bins
+in a process pool, which also checks the timing tags, and writes each
+model's capabilities back to the index, so the config flow can describe and
+filter models without opening any bin:
+
+    python tools/build_index.py [--codes DIR] [--index FILE] [--force]
+
+A model entry gains:
+    capabilities  get_index_capabilities of the bin: modes, fan speeds,
+                  swing modes, temperature range, frame length in bytes
+                  and checksum types
+    error         instead of capabilities, why the integration would
+                  reject the bin
+    mtime, sha256 of the bin the entry was built from
+
+Only bins whose mtime and content changed since the last run are parsed
+again, unless --force is given. Bins of the directory missing from the
+index are reported, they have no brand to be listed under. Run it before
+pack_codes.py, the pack copies the index as it is.
+"""
+import argparse
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from integration import CODES_DIR
+from smartac.irext import AC
+from smartac.util import CommandTable, get_index_capabilities
+
+INDEX_FILE = 'index.json'
+# keys of a model entry written by this tool
+ENTRY_KEYS = ('capabilities', 'error', 'mtime', 'sha256')
+
+
+def index_bin(bin_data):
+    """Return the capabilities or the error of a bin, as stored in its index entry."""
+    try:
+        ac = AC(bin_data)
+        if not ac.get_supported_mode():
+            raise ValueError('no supported mode')
+        # the timing tags are only parsed when a frame is decoded
+        CommandTable.from_ac(ac)
+        return {'capabilities': get_index_capabilities(ac)}
+    except Exception as e:
+        return {'error': '%s: %s' % (type(e).__name__, e)}
+
+
+def _read_and_index(path):
+    with open(path, 'rb') as f:
+        bin_data = f.read()
+    entry = index_bin(bin_data)
+    entry['sha256'] = hashlib.sha256(bin_data).hexdigest()
+    return entry
+
+
+def _cached_entry(previous, path, mtime):
+    """Return the previous entry of a bin when the bin is unchanged, else None."""
+    if previous is None or ('capabilities' not in previous and 'error' not in previous):
+        return None
+    if previous.get('mtime') == mtime:
+        return previous
+    with open(path, 'rb') as f:
+        if hashlib.sha256(f.read()).hexdigest() == previous.get('sha256'):
+            return previous
+    return None
+
+
+def build(codes_dir, index_path, force=False, jobs=None):
+    """Update the model entries of an index, return the index and the counts of parsed, reused and missing bins."""
+    with open(index_path) as f:
+        index = json.load(f)
+
+    # bin -> entries listing it, a bin may be listed by several brands
+    listings = {}
+    for brand in index:
+        for device in brand['devices']:
+            listings.setdefault(device['bin'], []).append(device)
+
+    entries = {}
+    pending = {}
+    missing = []
+    for name, devices in listings.items():
+        path = os.path.join(codes_dir, name)
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            missing.append(name)
+            continue
+        previous = None if force else _cached_entry(devices[0], path, mtime)
+        if previous is not None:
+            entries[name] = {key: previous[key] for key in ENTRY_KEYS if key in previous}
+            entries[name]['mtime'] = mtime
+        else:
+            pending[name] = (path, mtime)
+
+    with ProcessPoolExecutor(jobs) as executor:
+        results = executor.map(_read_and_index, [path for path, mtime in pending.values()], chunksize=8)
+        for (name, (path, mtime)), entry in zip(pending.items(), results):
+            entry['mtime'] = mtime
+            entries[name] = entry
+
+    for name, devices in listings.items():
+        for device in devices:
+            for key in ENTRY_KEYS:
+                device.pop(key, None)
+            device.update(entries.get(name, {}))
+
+    unlisted = sorted(name for name in os.listdir(codes_dir)
+                      if name.endswith('.bin') and name not in listings)
+    return index, len(pending), len(entries) - len(pending), missing, unlisted
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--codes', default=CODES_DIR, help='directory of irext bins')
+    parser.add_argument('--index', help='index file to update, index.json of the codes directory by default')
+    parser.add_argument('--force', action='store_true', help='parse every bin, even unchanged ones')
+    parser.add_argument('--jobs', type=int, help='worker processes, one per cpu by default')
+    args = parser.parse_args()
+
+    index_path = args.index or os.path.join(args.codes, INDEX_FILE)
+    index, parsed, reused, missing, unlisted = build(args.codes, index_path, args.force, args.jobs)
+
+    tmp_path = index_path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(index, f, indent=4)
+    os.replace(tmp_path, index_path)
+
+    invalid = sorted({device['bin'] for brand in index for device in brand['devices'] if 'error' in device})
+    print('%d bins parsed, %d unchanged, %d invalid' % (parsed, reused, len(invalid)))
+    for name in invalid:
+        print('invalid: %s' % name)
+    for name in missing:
+        print('missing: %s' % name)
+    for name in unlisted:
+        print('not in the index: %s' % name)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+"""Validate, and optionally compile, every bin of an irext code library.
+
+Parses each bin in a process pool, reads the modes, speeds and temperatures
+of every mode and decodes all its frames, then prints a report:
+
+    python tools/check_codes.py [--codes DIR] [--output report.json]
+    python tools/check_codes.py --compile [--cache DIR]
+
+With --compile the cache file of every valid bin is written as well, by
+default to the compiled directory the integration loads them from, so a
+library can be shipped precompiled.
+
+Reported per bin:
+    ms       parsing, capabilities and decoding all frames
+    frames   frames of the model
+    unique   distinct frames
+    pulses   pulses of the distinct frames
+    bytes    size of the cache file, or of the bin when not compiling
+    error    why the bin is invalid, the integration would reject it
+    warning  durations too long for a frame, sent clamped
+
+Exits with status 1 when any bin is invalid. Bins are read from the codes
+directory even when a pack file is present, pack them once they pass.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+
+from integration import CODES_DIR
+from smartac.cache import cache_path, write_cache
+from smartac.irext import AC, MAX_PULSE
+from smartac.util import CommandTable
+
+CACHE_DIR = os.path.join(CODES_DIR, 'compiled')
+
+
+def check_bin(path, cache_dir=None):
+    """Return the report of one bin, writing its cache file to cache_dir when given."""
+    result = {'bin': os.path.basename(path)}
+    start = time.perf_counter()
+    try:
+        with open(path, 'rb') as f:
+            bin_data = f.read()
+        result['bytes'] = len(bin_data)
+
+        ac = AC(bin_data)
+        modes = ac.get_supported_mode()
+        if not modes:
+            raise ValueError('no supported mode')
+        for mode in modes:
+            ac.get_temperature_range(mode)
+            ac.get_supported_wind_speed(mode)
+        table = CommandTable.from_ac(ac)
+
+        if ac.clamped_tags:
+            result['warning'] = 'durations above %d us clamped in tags %s' % (MAX_PULSE, sorted(ac.clamped_tags))
+        result['frames'] = table.frame_count
+        result['unique'] = table.unique_count
+        result['pulses'] = len(table.pulses)
+        if cache_dir is not None:
+            compiled = cache_path(cache_dir, result['bin'])
+            write_cache(compiled, bin_data, ac, table)
+            result['bytes'] = os.path.getsize(compiled)
+    except Exception as e:
+        result['error'] = '%s: %s' % (type(e).__name__, e)
+    result['ms'] = (time.perf_counter() - start) * 1e3
+    return result
+
+
+def run(codes_dir, cache_dir=None, jobs=None):
+    """Check every bin of a directory, in name order."""
+    paths = [os.path.join(codes_dir, name) for name in sorted(os.listdir(codes_dir))
+             if name.endswith('.bin')]
+    with ProcessPoolExecutor(jobs) as executor:
+        return list(executor.map(check_bin, paths, repeat(cache_dir), chunksize=8))
+
+
+def print_report(results):
+    print('%-28s %9s %7s %7s %8s %9s' % ('bin', 'ms', 'frames', 'unique', 'pulses', 'bytes'))
+    for r in results:
+        if 'error' in r:
+            print('%-28s %9.1f  %s' % (r['bin'], r['ms'], r['error']))
+        else:
+            print('%-28s %9.1f %7d %7d %8d %9d' % (
+                r['bin'], r['ms'], r['frames'], r['unique'], r['pulses'], r['bytes']))
+            if 'warning' in r:
+                print('%-28s %9s  %s' % ('', '', r['warning']))
+    failed = sum(1 for r in results if 'error' in r)
+    print('%d bins, %d invalid, %.1fs of decoding' % (
+        len(results), failed, sum(r['ms'] for r in results) / 1e3))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--codes', default=CODES_DIR, help='directory of irext bins')
+    parser.add_argument('--compile', action='store_true', help='write the cache file of every valid bin')
+    parser.add_argument('--cache', default=CACHE_DIR, help='directory of the cache files')
+    parser.add_argument('--jobs', type=int, help='worker processes, one per cpu by default')
+    parser.add_argument('--output', help='json file to write the report to')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    results = run(args.codes, args.cache if args.compile else None, args.jobs)
+    print_report(results)
+    print('%.1fs elapsed' % (time.perf_counter() - start))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    sys.exit(1 if any('error' in r for r in results) else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,19 @@
+"""Import the code library modules of the integration without home assistant.
+
+custom_components/smartac/__init__.py sets up the integration and imports
+home assistant, while irext, util, cache and pack don't. Importing this
+module registers the integration directory as the smartac package without
+running that __init__, so the tools can import smartac.cache and the like.
+"""
+import os
+import sys
+import types
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PACKAGE_DIR = os.path.join(ROOT, 'custom_components', 'smartac')
+CODES_DIR = os.path.join(PACKAGE_DIR, 'codes')
+
+if 'smartac' not in sys.modules:
+    package = types.ModuleType('smartac')
+    package.__path__ = [PACKAGE_DIR]
+    sys.modules['smartac'] = package
@@ -0,0 +1,45 @@
+"""Pack a code library into one file.
+
+Writes the index file and every bin it lists to a pack file, which the
+integration reads instead of the loose files when it is present:
+
+    python tools/pack_codes.py [--codes DIR] [--output FILE]
+
+The pack goes to library.pack of the codes directory by default. The loose
+files are still used for bins the pack doesn't have, and the whole library
+when the pack is removed. The integration prefers the pack, so pack again
+after changing a bin or the index, or the change won't be seen.
+"""
+import argparse
+import json
+import os
+import sys
+
+from integration import CODES_DIR
+from smartac.pack import PACK_FILE, write_pack
+
+INDEX_FILE = 'index.json'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--codes', default=CODES_DIR, help='directory of the index file and the bins')
+    parser.add_argument('--output', help='pack file to write, library.pack of the codes directory by default')
+    args = parser.parse_args()
+
+    with open(os.path.join(args.codes, INDEX_FILE)) as f:
+        index = json.load(f)
+    missing = sorted({device['bin'] for brand in index for device in brand['devices']
+                      if not os.path.exists(os.path.join(args.codes, device['bin']))})
+    for name in missing:
+        print('missing: %s' % name)
+    if missing:
+        sys.exit(1)
+
+    path = args.output or os.path.join(args.codes, PACK_FILE)
+    count = write_pack(path, index, args.codes)
+    print('%d bins packed to %s, %d bytes' % (count, path, os.path.getsize(path)))
+
+
+if __name__ == '__main__':
+    main()